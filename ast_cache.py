@@ -0,0 +1,117 @@
+import marshal
+import zlib
+from typing import Optional
+
+from ast_lib import (AssignStmt, BinaryOp, BoolLit, ExitStmt, FunctionCall, IfStmt, IntLit, LetStmt,
+                     PrintStmt, ProcessorStmt, Program, StringLit, UnaryOp, Var, WhileStmt)
+from cache import Cache, buffer_digest, compiler_version, content_key
+from lexer import buffer_tokens
+from parser_1 import Parser
+from timing import IteratorClock, PhaseTimer, phase
+from tracing import trace
+
+AST_FORMAT_VERSION = 1
+
+# Serialization tags are indexes into this tuple, followed by the list and None markers.
+_NODE_CLASSES = (Program, IntLit, BoolLit, StringLit, Var, BinaryOp, UnaryOp, LetStmt, AssignStmt,
+                 PrintStmt, ExitStmt, IfStmt, WhileStmt, FunctionCall, ProcessorStmt)
+_TAGS = {cls: tag for tag, cls in enumerate(_NODE_CLASSES)}
+LIST_TAG = len(_NODE_CLASSES)
+NONE_TAG = LIST_TAG + 1
+
+# Scalar (non-child) fields of each node class, in slot order.
+_SCALARS = {cls: tuple(name for name in cls.__slots__ if name not in cls.children) for cls in _NODE_CLASSES}
+
+
+def dump_ast(program: Program) -> bytes:
+    """Serialize a tree into compressed marshal bytes.
+
+    The tree is flattened in post-order: a node's children first, then its tag and
+    scalar fields, with LIST_TAG <count> closing each statement list. Both directions
+    run on explicit stacks, so arbitrarily deep trees round-trip without recursion.
+    """
+    flat = []
+    stack = [(program, False)]
+    while stack:
+        item, children_done = stack.pop()
+        if item is None:
+            flat.append(NONE_TAG)
+        elif children_done:
+            if type(item) is list:
+                flat.append(LIST_TAG)
+                flat.append(len(item))
+            else:
+                cls = type(item)
+                flat.append(_TAGS[cls])
+                flat.extend(getattr(item, name) for name in _SCALARS[cls])
+        else:
+            stack.append((item, True))
+            children = item if type(item) is list else [getattr(item, name) for name in item.children]
+            stack.extend((child, False) for child in reversed(children))
+    return zlib.compress(marshal.dumps(flat), 1)
+
+
+def load_ast(data: bytes) -> Program:
+    """Rebuild the tree written by dump_ast."""
+    nodes = []
+    flat = iter(marshal.loads(zlib.decompress(data)))
+    for tag in flat:
+        if tag == LIST_TAG:
+            count = next(flat)
+            items = nodes[len(nodes) - count:]
+            del nodes[len(nodes) - count:]
+            nodes.append(items)
+        elif tag == NONE_TAG:
+            nodes.append(None)
+        else:
+            cls = _NODE_CLASSES[tag]
+            node = cls.__new__(cls)
+            for name in _SCALARS[cls]:
+                setattr(node, name, next(flat))
+            for name in reversed(cls.children):
+                setattr(node, name, nodes.pop())
+            nodes.append(node)
+    return nodes[0]
+
+
+def parse_source(source, cache: Optional[Cache] = None, source_digest: Optional[str] = None,
+                 name: str = "<source>", timer: Optional[PhaseTimer] = None) -> Program:
+    """Lex and parse a bytes-like buffer, reusing a cached tree when the source is unchanged.
+
+    The cache key covers the source digest, the serialization format and the compiler
+    version, so a hit skips lexing and parsing entirely. Callers that already hashed
+    the source can pass its digest along; `name` is only used in traces. The parser
+    reads tokens as the scanner produces them; with a timer, the time spent in the
+    scanner is reported as the lex phase and the rest as parse. Memory is reported
+    for the two together, under parse.
+    """
+    key = None
+    if cache is not None:
+        with phase(timer, "ast_cache"):
+            if source_digest is None:
+                source_digest = buffer_digest(source)
+            key = content_key(source_digest, str(AST_FORMAT_VERSION), compiler_version())
+            data = cache.get(key)
+            if data is not None:
+                if trace.cache:
+                    trace.log("cache", f"AST hit for {name}")
+                return load_ast(data)
+        if trace.cache:
+            trace.log("cache", f"AST miss for {name}")
+
+    tokens = buffer_tokens(source)
+    if timer is not None:
+        tokens = clock = IteratorClock(tokens)
+        timer.record("lex", 0.0, 0.0)  # list lex before parse; its time is split off below
+    try:
+        with phase(timer, "parse"):
+            program = Parser(tokens).parse()
+    finally:
+        tokens.close()  # drop the scanner's export of the buffer, so an mmap can be closed
+    if timer is not None:
+        timer.split("parse", "lex", clock.wall)
+        timer.counts["tokens"] = clock.items - 1  # not counting the end marker
+    if key is not None:
+        with phase(timer, "ast_cache"):
+            cache.put(key, dump_ast(program))
+    return program
@@ -1,12 +1,12 @@
-from dataclasses import dataclass
 from enum import Enum, auto
-from typing import Optional, List
+from typing import Dict, Iterator, List, Optional, Tuple
 
 class NodeType(Enum):
     PROGRAM = auto()
     EXIT_STMT = auto()
     INT_LIT = auto()
     BINARY_OP = auto()
+    UNARY_OP = auto()
     PAREN_EXPR = auto()
     PRINT_STMT = auto()
     LET_STMT = auto()
@@ -26,24 +26,239 @@ class NodeType(Enum):
     ASSIGN_STMT = auto()
     PROCESSOR_STMT = auto()
 
-@dataclass
+
 class ASTNode:
+    """Base class for AST nodes.
+
+    Each node kind is its own __slots__ class that stores only its own fields; the
+    NodeType is a class attribute. `children` names the fields holding a child node,
+    a list of nodes or None, in evaluation order, and `label` names the scalar field
+    print_ast shows next to the node type.
+    """
+
+    __slots__ = ()
     type: NodeType
-    value: Optional[str] = None
-    left: Optional['ASTNode'] = None
-    right: Optional['ASTNode'] = None
-    next_node: Optional['ASTNode'] = None
-    else_node: Optional['ASTNode'] = None
-    args: Optional[List['ASTNode']] = None
-    body: Optional['ASTNode'] = None
-    condition: Optional['ASTNode'] = None
-    increment: Optional['ASTNode'] = None
-    return_value: Optional['ASTNode'] = None
-    function_name: Optional[str] = None
-def print_ast(node: ASTNode, indent: int = 0):
+    children: Tuple[str, ...] = ()
+    label: Optional[str] = None
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class Program(ASTNode):
+    __slots__ = ("body",)
+    type = NodeType.PROGRAM
+    children = ("body",)
+
+    def __init__(self, body: List[ASTNode]):
+        self.body = body
+
+
+class IntLit(ASTNode):
+    __slots__ = ("value",)
+    type = NodeType.INT_LIT
+    label = "value"
+
+    def __init__(self, value: int):
+        self.value = value
+
+
+class BoolLit(ASTNode):
+    __slots__ = ("value",)
+    type = NodeType.BOOL_LIT
+    label = "value"
+
+    def __init__(self, value: bool):
+        self.value = value
+
+
+class StringLit(ASTNode):
+    __slots__ = ("value",)
+    type = NodeType.STRING_LIT
+    label = "value"
+
+    def __init__(self, value: str):
+        self.value = value
+
+
+class Var(ASTNode):
+    __slots__ = ("name",)
+    type = NodeType.VAR
+    label = "name"
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+class BinaryOp(ASTNode):
+    __slots__ = ("op", "left", "right")
+    type = NodeType.BINARY_OP
+    children = ("left", "right")
+    label = "op"
+
+    def __init__(self, op: str, left: ASTNode, right: ASTNode):
+        self.op = op
+        self.left = left
+        self.right = right
+
+
+class UnaryOp(ASTNode):
+    __slots__ = ("op", "operand")
+    type = NodeType.UNARY_OP
+    children = ("operand",)
+    label = "op"
+
+    def __init__(self, op: str, operand: ASTNode):
+        self.op = op
+        self.operand = operand
+
+
+class LetStmt(ASTNode):
+    __slots__ = ("name", "expr")
+    type = NodeType.LET_STMT
+    children = ("expr",)
+    label = "name"
+
+    def __init__(self, name: str, expr: ASTNode):
+        self.name = name
+        self.expr = expr
+
+
+class AssignStmt(ASTNode):
+    __slots__ = ("name", "expr")
+    type = NodeType.ASSIGN_STMT
+    children = ("expr",)
+    label = "name"
+
+    def __init__(self, name: str, expr: ASTNode):
+        self.name = name
+        self.expr = expr
+
+
+class PrintStmt(ASTNode):
+    __slots__ = ("arg",)
+    type = NodeType.PRINT_STMT
+    children = ("arg",)
+
+    def __init__(self, arg: ASTNode):
+        self.arg = arg
+
+
+class ExitStmt(ASTNode):
+    __slots__ = ("arg",)
+    type = NodeType.EXIT_STMT
+    children = ("arg",)
+
+    def __init__(self, arg: Optional[ASTNode]):
+        self.arg = arg
+
+
+class IfStmt(ASTNode):
+    __slots__ = ("condition", "then_body", "else_body")
+    type = NodeType.IF_STMT
+    children = ("condition", "then_body", "else_body")
+
+    def __init__(self, condition: ASTNode, then_body: List[ASTNode], else_body: List[ASTNode]):
+        self.condition = condition
+        self.then_body = then_body
+        self.else_body = else_body
+
+
+class WhileStmt(ASTNode):
+    __slots__ = ("condition", "body")
+    type = NodeType.WHILE_STMT
+    children = ("condition", "body")
+
+    def __init__(self, condition: ASTNode, body: List[ASTNode]):
+        self.condition = condition
+        self.body = body
+
+
+class FunctionCall(ASTNode):
+    __slots__ = ("function_name", "args")
+    type = NodeType.FUNCTION_CALL
+    children = ("args",)
+    label = "function_name"
+
+    def __init__(self, function_name: str, args: List[ASTNode]):
+        self.function_name = function_name
+        self.args = args
+
+
+class ProcessorStmt(ASTNode):
+    __slots__ = ("name", "params", "body")
+    type = NodeType.PROCESSOR_STMT
+    children = ("body",)
+    label = "name"
+
+    def __init__(self, name: str, params: List[str], body: List[ASTNode]):
+        self.name = name
+        self.params = params
+        self.body = body
+
+
+def walk(node: Optional[ASTNode]) -> Iterator[Tuple[ASTNode, int]]:
+    """Pre-order traversal with an explicit stack, yielding (node, depth).
+
+    Statements in a body sit one level below their owner, so long statement lists
+    and deeply nested expressions never grow the Python stack.
+    """
+    stack = [(node, 0)]
+    while stack:
+        node, depth = stack.pop()
+        if node is None:
+            continue
+        yield node, depth
+        depth += 1
+        for name in reversed(node.children):
+            child = getattr(node, name)
+            if type(child) is list:
+                stack.extend((item, depth) for item in reversed(child))
+            elif child is not None:
+                stack.append((child, depth))
+
+
+def copy_tree(node: ASTNode) -> ASTNode:
+    """A deep copy of the subtree, built without recursion; scalar fields are shared."""
+    nodes = [original for original, _ in walk(node)]
+    copies = {}
+    for original in nodes:
+        copy = object.__new__(type(original))
+        for name in original.__slots__:
+            setattr(copy, name, getattr(original, name))
+        copies[id(original)] = copy
+    for original in nodes:
+        copy = copies[id(original)]
+        for name in original.children:
+            child = getattr(original, name)
+            if type(child) is list:
+                setattr(copy, name, [copies[id(item)] for item in child])
+            elif child is not None:
+                setattr(copy, name, copies[id(child)])
+    return copies[id(node)]
+
+
+def initial_values(program: Program) -> Dict[str, int]:
+    """The value each declared variable holds before the program runs.
+
+    That is the code generator's .data initializer: the literal of the variable's
+    last `let` with an integer literal, else 0. A variable read before its `let`
+    sees it, so optimizations must keep it even when they rewrite or remove the
+    `let`s it came from.
+    """
+    values = {}
+    for node, _ in walk(program):
+        if type(node) is LetStmt:
+            if type(node.expr) is IntLit:
+                values[node.name] = node.expr.value
+            else:
+                values.setdefault(node.name, 0)
+    return values
+
+
+def print_ast(node: ASTNode, indent: int = 0, file=None):
     """Pretty print the AST"""
-    if not node:
-        return
-    print("  " * indent + f"{node.type.name}: {node.value if node.value else ''}")
-    print_ast(node.left, indent + 1)
-    print_ast(node.right, indent + 1)
\ No newline at end of file
+    for child, depth in walk(node):
+        label = getattr(child, child.label) if child.label else ''
+        print("  " * (indent + depth) + f"{child.type.name}: {label}", file=file)
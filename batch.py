@@ -0,0 +1,115 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from cache import AST_CACHE_NAMESPACE, DEFAULT_MAX_BYTES, OUTPUT_CACHE_NAMESPACE, CacheStats, DiskCache
+from compiler import compile_file
+from errors import CompileError
+from options import CompileOptions
+from timing import PhaseTimer
+from tracing import trace
+
+# Jobs are sent to workers in chunks of up to this many files, so a batch of small
+# sources is not dominated by per-task IPC while big batches still balance load.
+MAX_CHUNK_SIZE = 32
+
+
+class BatchResult:
+    __slots__ = ("input_file", "output_file", "error", "warnings", "timing")
+
+    def __init__(self, input_file: str, output_file: str, error: Optional[str] = None,
+                 warnings: Sequence[str] = (), timing: Optional[dict] = None):
+        self.input_file = input_file
+        self.output_file = output_file
+        self.error = error
+        self.warnings = list(warnings)
+        self.timing = timing  # PhaseTimer.as_dict() when --time-passes is on
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def default_workers() -> int:
+    """Cores this process may run on (respects CPU affinity, e.g. in containers)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+# Per-process state, set up once by _init_worker rather than shipped with every job.
+_options = None
+_output_cache = None
+_ast_cache = None
+_time_passes = False
+
+
+def _init_worker(options: CompileOptions, cache_dir: Optional[str], cache_max_bytes: int,
+                 trace_spec: Optional[str], time_passes: bool):
+    global _options, _output_cache, _ast_cache, _time_passes
+    _options = options
+    _time_passes = time_passes
+    if cache_dir:
+        _output_cache = DiskCache(cache_dir, OUTPUT_CACHE_NAMESPACE, cache_max_bytes)
+        _ast_cache = DiskCache(cache_dir, AST_CACHE_NAMESPACE, cache_max_bytes)
+    if trace_spec is not None:
+        trace.configure(trace_spec)
+
+
+def run_job(input_file: str, output_file: str, options: CompileOptions, output_cache=None,
+            ast_cache=None, time_passes: bool = False) -> BatchResult:
+    """Compile one file, turning any failure into a BatchResult rather than an exception."""
+    timer = PhaseTimer() if time_passes else None
+    try:
+        result = compile_file(input_file, output_file, options, output_cache, ast_cache, timer)
+    except CompileError as error:
+        return BatchResult(input_file, output_file, str(error))
+    except OSError as error:
+        return BatchResult(input_file, output_file, f"{error.strerror}: {error.filename}")
+    except Exception as error:
+        return BatchResult(input_file, output_file, f"internal compiler error: {type(error).__name__}: {error}")
+    return BatchResult(input_file, output_file, warnings=[diagnostic.message for diagnostic in result.diagnostics],
+                       timing=timer.as_dict() if timer is not None else None)
+
+
+def _compile_chunk(jobs: Sequence[Tuple[str, str]]) -> Tuple[List[BatchResult], Dict[str, CacheStats]]:
+    """Compile a chunk of (input, output) pairs, returning their results and the chunk's cache stats."""
+    results = [run_job(input_file, output_file, _options, _output_cache, _ast_cache, _time_passes)
+               for input_file, output_file in jobs]
+    stats = {}
+    for cache in (_output_cache, _ast_cache):
+        if cache is not None:
+            stats[cache.namespace] = cache.stats
+            cache.stats = CacheStats()
+    return results, stats
+
+
+def compile_batch(jobs: Sequence[Tuple[str, str]], options: CompileOptions, cache_dir: Optional[str] = None,
+                  cache_max_bytes: int = DEFAULT_MAX_BYTES, workers: Optional[int] = None,
+                  trace_spec: Optional[str] = None,
+                  time_passes: bool = False) -> Tuple[List[BatchResult], Dict[str, CacheStats]]:
+    """Compile (input, output) pairs across a process pool.
+
+    A failing file becomes a BatchResult carrying its error; the other files are still
+    compiled. Results come back in job order, along with cache stats summed over all
+    workers. A single job, or workers=1, runs in this process without a pool.
+    """
+    if workers is None:
+        workers = default_workers()
+    workers = max(1, min(workers, len(jobs)))
+    init_args = (options, cache_dir, cache_max_bytes, trace_spec, time_passes)
+
+    if workers == 1:
+        _init_worker(*init_args)
+        return _compile_chunk(jobs)
+
+    chunk_size = max(1, min(MAX_CHUNK_SIZE, len(jobs) // (workers * 4)))
+    chunks = [jobs[start:start + chunk_size] for start in range(0, len(jobs), chunk_size)]
+    results = []
+    totals = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_args) as executor:
+        for chunk_results, chunk_stats in executor.map(_compile_chunk, chunks):
+            results.extend(chunk_results)
+            for namespace, stats in chunk_stats.items():
+                totals.setdefault(namespace, CacheStats()).add(stats)
+    return results, totals
@@ -0,0 +1,283 @@
+"""Compiler benchmark over synthetic programs.
+
+Generates programs of growing size along four axes (statement count, expression
+depth, if/while nesting depth, variable count), times the lexer, the parser and
+the code generator separately and records each phase's tracemalloc peak.
+
+Two checks guard against regressions:
+  * scaling: within each family the sizes grow geometrically, and a phase whose
+    time grows faster than SCALING_LIMIT-th power of the size (e.g. quadratic) is
+    flagged; this check does not depend on the machine.
+  * baseline: times and peaks are compared with a stored JSON baseline, and ratios
+    above --threshold / --memory-threshold are flagged.
+
+    python benchmark.py                     # run and compare with benchmark_baseline.json
+    python benchmark.py --update-baseline   # record a new baseline on this machine
+"""
+import argparse
+import gc
+import json
+import math
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from code_generator import CodeGenerator
+from lexer import tokenize
+from parser_1 import Parser
+
+DEFAULT_BASELINE = "benchmark_baseline.json"
+PHASES = ("lex", "parse", "codegen")
+# Within a family, flag phases whose time grows faster than size ** SCALING_LIMIT.
+SCALING_LIMIT = 1.75  # quadratic is 2; cache effects alone can push small sizes past 1.5
+# Sizes closer than this ratio say nothing about growth: timing noise dominates the exponent.
+MIN_SIZE_RATIO = 1.5
+# Timings below this many seconds are too noisy to compare against a baseline.
+NOISE_FLOOR = 0.005
+
+ARITHMETIC_OPS = ("+", "-", "*", "/")
+COMPARISON_OPS = ("<", "<=", ">", ">=", "==", "!=")
+
+# family -> (varying parameter, values, fixed parameters)
+SCENARIOS = {
+    "statements": ("statements", (2000, 8000, 32000), {}),
+    "expr_depth": ("expr_depth", (8, 32, 128, 512), {"statements": 500}),
+    "nesting": ("nest_depth", (2, 8, 32), {"statements": 4000}),
+    "variables": ("variables", (16, 256, 4096), {"statements": 4000}),
+}
+QUICK_SCALE = 4  # --quick divides statement and variable counts by this
+# Families whose source size barely follows their parameter; the scaling check measures
+# their growth against the parameter itself.
+SCALE_BY_PARAMETER = ("nesting", "variables")
+
+
+class ProgramGenerator:
+    """Deterministic random program of a given shape.
+
+    statements counts every statement after the `let` declarations of the
+    variables, including those nested in if/while bodies. Expressions are fully
+    parenthesized binary trees whose depth is exactly expr_depth along one path,
+    with shallow operands elsewhere, so their size grows linearly with depth.
+    """
+
+    def __init__(self, statements=1000, expr_depth=4, nest_depth=2, variables=16, seed=0):
+        self.statements = statements
+        self.expr_depth = expr_depth
+        self.nest_depth = nest_depth
+        self.names = [_variable_name(index) for index in range(max(1, variables))]
+        self.rng = random.Random(seed)
+
+    def generate(self) -> str:
+        lines = [f"let {name} = {index};" for index, name in enumerate(self.names)]
+        remaining = self.statements
+        while remaining > 0:
+            remaining -= self._statement(lines, 0, remaining)
+        return "\n".join(lines) + "\n"
+
+    def _statement(self, lines, depth, budget, nest=False) -> int:
+        """Append one statement (with any nested body) using at most `budget` statements; return the count used.
+
+        The first statement of every body nests further (nest=True) while the depth
+        allows, so programs actually reach nest_depth.
+        """
+        rng = self.rng
+        indent = "    " * depth
+        if budget > 1 and depth < self.nest_depth and (nest or rng.random() < 0.3):
+            keyword = rng.choice(("if", "while"))
+            lines.append(f"{indent}{keyword} ({self._condition()}) {{")
+            body = max(rng.randint(2, 8), self.nest_depth - depth)  # room to nest all the way down
+            used = 1 + self._block(lines, depth + 1, min(budget - 1, body))
+            if keyword == "if" and used < budget and rng.random() < 0.5:
+                lines.append(f"{indent}}} else {{")
+                used += self._block(lines, depth + 1, min(budget - used, rng.randint(1, 4)))
+            lines.append(f"{indent}}}")
+            return used
+        if rng.random() < 0.05:
+            lines.append(f'{indent}print("line {len(lines)}");')
+        else:
+            lines.append(f"{indent}assign {rng.choice(self.names)} = {self._expression(self.expr_depth)};")
+        return 1
+
+    def _block(self, lines, depth, budget) -> int:
+        used = self._statement(lines, depth, budget, nest=True)
+        while used < budget:
+            used += self._statement(lines, depth, budget - used)
+        return used
+
+    def _condition(self) -> str:
+        depth = max(1, self.expr_depth // 2)
+        return f"{self._expression(depth)} {self.rng.choice(COMPARISON_OPS)} {self._expression(depth)}"
+
+    def _expression(self, depth: int) -> str:
+        rng = self.rng
+        if depth <= 1:
+            return rng.choice(self.names) if rng.random() < 0.6 else str(rng.randint(0, 1000))
+        deep = self._expression(depth - 1)
+        shallow = self._expression(rng.randint(1, min(2, depth - 1)))
+        left, right = (deep, shallow) if rng.random() < 0.5 else (shallow, deep)
+        return f"({left} {rng.choice(ARITHMETIC_OPS)} {right})"
+
+
+def _variable_name(index: int) -> str:
+    """v + index in base 26 letters: identifiers are letters only, and no keyword starts with v."""
+    letters = ""
+    while True:
+        index, digit = divmod(index, 26)
+        letters = chr(ord("a") + digit) + letters
+        if index == 0:
+            return "v" + letters
+
+
+def generate_program(statements=1000, expr_depth=4, nest_depth=2, variables=16, seed=0) -> str:
+    return ProgramGenerator(statements, expr_depth, nest_depth, variables, seed).generate()
+
+
+def _run_phases(source: bytes):
+    """Run lex, parse and codegen once, yielding (phase, seconds) as each finishes."""
+    start = time.perf_counter()
+    tokens = tokenize(source)
+    yield "lex", time.perf_counter() - start
+    start = time.perf_counter()
+    ast = Parser(tokens).parse()
+    yield "parse", time.perf_counter() - start
+    start = time.perf_counter()
+    CodeGenerator(ast).generate_code()
+    yield "codegen", time.perf_counter() - start
+
+
+def measure(source: bytes, repeat: int) -> dict:
+    """Best-of-`repeat` time and tracemalloc peak for each phase.
+
+    A phase's peak counts everything alive while it runs, including the tokens or
+    tree handed to it by the previous phase.
+    """
+    results = {phase: {"seconds": math.inf, "peak_bytes": 0} for phase in PHASES}
+    for _ in range(repeat):
+        gc.collect()  # don't bill this run for the previous run's garbage
+        for phase, seconds in _run_phases(source):
+            results[phase]["seconds"] = min(results[phase]["seconds"], seconds)
+
+    # A separate traced run: tracemalloc slows allocation down too much to time under it.
+    tracemalloc.start()
+    try:
+        for phase, _ in _run_phases(source):
+            results[phase]["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+    finally:
+        tracemalloc.stop()
+    return results
+
+
+def run_scenarios(quick: bool, repeat: int, log=sys.stderr) -> dict:
+    results = {}
+    for family, (parameter, values, fixed) in SCENARIOS.items():
+        for value in values:
+            shape = dict(fixed, **{parameter: value})
+            if quick:
+                for key in ("statements", "variables"):
+                    if key in shape:
+                        shape[key] = max(1, shape[key] // QUICK_SCALE)
+            source = generate_program(**shape).encode()
+            name = f"{family}/{parameter}={shape[parameter]}"
+            results[name] = measure(source, repeat)
+            results[name]["source_bytes"] = len(source)
+            results[name]["parameter"] = shape[parameter]
+            log.write(f"{name:32} {len(source):>10} B  " + "  ".join(
+                f"{phase} {results[name][phase]['seconds'] * 1000:8.1f} ms" for phase in PHASES) + "\n")
+    return results
+
+
+def check_scaling(results: dict) -> list:
+    """Flag phases that grow faster than size ** SCALING_LIMIT between consecutive sizes of a family.
+
+    The size is the source size, or the varied parameter for SCALE_BY_PARAMETER
+    families. Pairs of sizes less than MIN_SIZE_RATIO apart are skipped.
+    """
+    problems = []
+    for family, (parameter, _, _) in SCENARIOS.items():
+        measure, label = ("parameter", parameter) if family in SCALE_BY_PARAMETER else ("source_bytes", "size")
+        runs = [(name, data) for name, data in results.items() if name.startswith(family + "/")]
+        for (small_name, small), (large_name, large) in zip(runs, runs[1:]):
+            size_ratio = large[measure] / small[measure]
+            if size_ratio < MIN_SIZE_RATIO:
+                continue
+            for phase in PHASES:
+                before, after = small[phase]["seconds"], large[phase]["seconds"]
+                if after < NOISE_FLOOR:
+                    continue
+                exponent = math.log(after / before) / math.log(size_ratio)
+                if exponent > SCALING_LIMIT:
+                    problems.append(f"{phase} grows as {label}^{exponent:.2f} from {small_name} to {large_name}")
+    return problems
+
+
+def compare(results: dict, baseline: dict, threshold: float, memory_threshold: float) -> list:
+    problems = []
+    for name, data in results.items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        for phase in PHASES:
+            seconds, old_seconds = data[phase]["seconds"], previous[phase]["seconds"]
+            if seconds >= NOISE_FLOOR and seconds > old_seconds * threshold:
+                problems.append(f"{name} {phase}: {seconds * 1000:.1f} ms vs baseline {old_seconds * 1000:.1f} ms "
+                                f"({seconds / old_seconds:.2f}x)")
+            peak, old_peak = data[phase]["peak_bytes"], previous[phase]["peak_bytes"]
+            if old_peak and peak > old_peak * memory_threshold:
+                problems.append(f"{name} {phase}: peak {peak / 1e6:.1f} MB vs baseline {old_peak / 1e6:.1f} MB "
+                                f"({peak / old_peak:.2f}x)")
+    return problems
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark the compiler phases on synthetic programs.")
+    arg_parser.add_argument("--quick", action="store_true", help=f"divide program sizes by {QUICK_SCALE}")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="time each phase as the best of N runs")
+    arg_parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON to compare with or update")
+    arg_parser.add_argument("--update-baseline", action="store_true", help="write the results as the new baseline")
+    arg_parser.add_argument("--threshold", type=float, default=1.25,
+                            help="flag phases slower than baseline by this factor")
+    arg_parser.add_argument("--memory-threshold", type=float, default=1.10,
+                            help="flag phases whose peak memory exceeds the baseline by this factor")
+    arg_parser.add_argument("--json", metavar="PATH", help="also write the results to PATH")
+    args = arg_parser.parse_args()
+
+    results = run_scenarios(args.quick, args.repeat)
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "quick": args.quick,
+        "scenarios": results,
+    }
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+    problems = check_scaling(results)
+    if args.update_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"baseline written to {args.baseline}")
+    else:
+        try:
+            with open(args.baseline) as file:
+                baseline = json.load(file)
+        except FileNotFoundError:
+            print(f"no baseline at {args.baseline}; run with --update-baseline to record one")
+        else:
+            if baseline.get("quick") != args.quick:
+                print("baseline was recorded with a different --quick setting; skipping comparison")
+            else:
+                problems += compare(results, baseline, args.threshold, args.memory_threshold)
+
+    for problem in problems:
+        print(f"REGRESSION: {problem}")
+    if problems:
+        sys.exit(1)
+    print("no regressions")
+
+
+if __name__ == "__main__":
+    main()
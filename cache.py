@@ -0,0 +1,215 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Union
+
+CACHE_DIR_ENV_VAR = "CASSAVA_CACHE_DIR"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MEMORY_MAX_BYTES = 64 * 1024 * 1024
+# Namespaces within a cache directory: parsed trees and finished assembly.
+AST_CACHE_NAMESPACE = "ast"
+OUTPUT_CACHE_NAMESPACE = "asm"
+# A process rescans the cache directory for eviction on its first write and then every
+# EVICT_INTERVAL writes, so batch builds do not pay a directory scan per file.
+EVICT_INTERVAL = 32
+
+_compiler_version = None
+
+
+def compiler_version() -> str:
+    """Digest of the compiler's own sources, so any change to the compiler invalidates cached results."""
+    global _compiler_version
+    if _compiler_version is None:
+        digest = hashlib.sha256()
+        for source in sorted(Path(__file__).resolve().parent.glob("*.py")):
+            digest.update(source.name.encode())
+            digest.update(source.read_bytes())
+        _compiler_version = digest.hexdigest()[:16]
+    return _compiler_version
+
+
+def buffer_digest(buffer) -> str:
+    """SHA-256 of a bytes-like source (bytes, mmap, memoryview), hashed in place without copying."""
+    return hashlib.sha256(buffer).hexdigest()
+
+
+def content_key(*parts) -> str:
+    """Hex key over byte/str parts; each part is length-prefixed so boundaries cannot collide."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode()
+        digest.update(len(part).to_bytes(8, "little"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class CacheStats:
+    """Hit/miss counters for one cache namespace; batch drivers add up the workers' stats."""
+
+    __slots__ = ("hits", "misses", "writes", "evictions")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def add(self, other: "CacheStats"):
+        for name in self.__slots__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def format(self, namespace: str) -> str:
+        return (f"{namespace} cache: {self.hits} hits, {self.misses} misses ({self.hit_rate:.0%} hit rate), "
+                f"{self.writes} writes, {self.evictions} evictions")
+
+
+class DiskCache:
+    """Content-addressed directory of blobs with size-bounded LRU eviction.
+
+    Entries live at <directory>/<namespace>/<key[:2]>/<key>. A read bumps the entry's
+    mtime, so eviction removes the least recently used entries first once the
+    namespace grows past max_bytes. Writes go to a temp file that is renamed into
+    place, so concurrent compilers never observe a partial entry.
+    """
+
+    def __init__(self, directory: str, namespace: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.namespace = namespace
+        self.root = Path(directory) / namespace
+        self.max_bytes = max_bytes
+        self._writes_until_evict = 0
+        self.stats = CacheStats()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        try:
+            os.utime(path)
+        except OSError:
+            pass  # evicted by a concurrent writer; the data we read is still valid
+        return data
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+        self.stats.writes += 1
+        if self._writes_until_evict <= 0:
+            self.evict()
+            self._writes_until_evict = EVICT_INTERVAL
+        self._writes_until_evict -= 1
+
+    def evict(self):
+        """Delete least recently used entries until the namespace fits in max_bytes."""
+        entries = []
+        total = 0
+        for path in self.root.glob("*/*"):
+            if path.name.startswith(".tmp-"):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            self.stats.evictions += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+class MemoryCache:
+    """In-process LRU of blobs, optionally in front of a DiskCache.
+
+    Used by long-lived processes such as the compile server: a hit costs a dict
+    lookup, misses fall through to the backing cache (whose hits are kept in memory
+    from then on), and puts write through. Safe to share between threads.
+    """
+
+    def __init__(self, namespace: str, max_bytes: int = DEFAULT_MEMORY_MAX_BYTES,
+                 backing: Optional[DiskCache] = None):
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self.backing = backing
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                return data
+        if self.backing is not None:
+            data = self.backing.get(key)
+        with self._lock:
+            if data is None:
+                self.stats.misses += 1
+                return None
+            self.stats.hits += 1
+            self._store(key, data)
+        return data
+
+    def put(self, key: str, data: bytes):
+        if self.backing is not None:
+            self.backing.put(key, data)
+        with self._lock:
+            self.stats.writes += 1
+            self._store(key, data)
+
+    def _store(self, key: str, data: bytes):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous)
+        if len(data) > self.max_bytes:
+            return
+        self._entries[key] = data
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self.stats.evictions += 1
+
+
+# Anything compile_file can read through: a directory cache or an in-memory layer over one.
+Cache = Union[DiskCache, MemoryCache]
@@ -1,63 +1,96 @@
-from ast_lib import ASTNode, NodeType
+from typing import Dict, Optional
+from ast_lib import ASTNode, NodeType, Program, initial_values, walk
+from errors import CodegenError, Diagnostic
+from runtime import OUTPUT_BSS, runtime_routines
+from strength_reduction import Reduction
+from timing import PhaseTimer, phase
+from tracing import trace
+
+# Registers expressions are evaluated in, in order of preference; variables may
+# additionally live in esi, edi and ebp (see register_allocation.py).
+SCRATCH_REGISTERS = ("eax", "ecx", "edx", "ebx")
+SCRATCH_SET = frozenset(SCRATCH_REGISTERS)
+DIVISION_REGISTERS = ("eax", "edx")
+LOW_BYTE = {"eax": "al", "ebx": "bl", "ecx": "cl", "edx": "dl"}
+ARITHMETIC_INSTRUCTIONS = {'+': "add", '-': "sub", '*': "imul"}
+LEAF_TYPES = (NodeType.INT_LIT, NodeType.VAR)
+
+# Conditional jump taken when `left op right` holds (signed), the operator testing the
+# opposite, and the operator for the same test with the operands swapped.
+JUMP_IF = {'<': "jl", '<=': "jle", '>': "jg", '>=': "jge", '==': "je", '!=': "jne"}
+NEGATED = {'<': '>=', '<=': '>', '>': '<=', '>=': '<', '==': '!=', '!=': '=='}
+SWAPPED = {'<': '>', '<=': '>=', '>': '<', '>=': '<=', '==': '==', '!=': '!='}
+
+# Registers for the first six call arguments (x86_64 calling convention)
+ARGUMENT_REGISTERS = ['rdi', 'rsi', 'rdx', 'rcx', 'r8', 'r9']
+
+
+class Branch:
+    """Work item: jump to `label` if `condition` is true (when=True) or false, else fall through.
+
+    target and free are the registers the condition may be evaluated in, as for
+    expressions.
+    """
+
+    __slots__ = ("condition", "label", "when", "target", "free")
+
+    def __init__(self, condition: ASTNode, label: str, when: bool, target: str = "eax", free=SCRATCH_SET):
+        self.condition = condition
+        self.label = label
+        self.when = when
+        self.target = target
+        self.free = free
 
-function_register_values = ['rax', 'rbx', 'rcx', 'rdx', 'rsi', 'rdi', 'r8', 'r9', 'r10', 'r11', 'r12', 'r13', 'r14', 'r15']
 
 class CodeGenerator:
-    def __init__(self, ast: ASTNode):
+    def __init__(self, ast: Program, registers: Optional[Dict[str, str]] = None,
+                 reductions: Optional[Dict[int, Reduction]] = None, seeds: Optional[Dict[str, int]] = None):
         self.ast = ast
+        self.seeds = seeds  # Initial variable values, if taken from the tree before optimization
+        self.registers = registers or {}  # Variables kept in a register instead of memory
+        self.reductions = reductions or {}  # Cheaper code for * and / by literals, by node id
         self.output = []
         self.label_counter = 0
         self.num_string_literals = 0
         self.string_literals = []
         self.variables = {}  # Maps variable names to their initialization status
         self.initial_values = {}  # Store initial values for variables
+        self.diagnostics = []  # Warnings about constructs that produced no code
+        self.prints_integers = False  # Which runtime output routines the program needs
+        self.prints_strings = False
+        self._unsupported = set()
 
-    def generate_code(self) -> str:
+    def generate_code(self, timer: Optional[PhaseTimer] = None) -> str:
         # First pass: collect all variable declarations and their initial values
-        self._collect_variables(self.ast)
-        
+        with phase(timer, "collect_variables"):
+            self._collect_variables(self.ast)
+        with phase(timer, "codegen"):
+            return self._emit_program()
+
+    def _emit_program(self) -> str:
         self.output.append("section .text")
         self.output.append("global _start")
         self.output.append("_start:")
 
         # Generate code for each statement in order
-        node = self.ast.right
-        print("\nGenerating code for statements:")
-        while node:
-            print(f"Processing node: {node.type} {node.value}")
-            if node.type == NodeType.LET_STMT:
-                print(f"  LET statement: {node.left.value} = {node.right.value if node.right else 'None'}")
-                self._generate_let_statement(node)
-            elif node.type == NodeType.EXIT_STMT:
-                print(f"  EXIT statement with arg: {node.left.type if node.left else 'None'}")
-                self._generate_exit_statement(node)
-            elif node.type == NodeType.PRINT_STMT:
-                self._generate_print_statement(node)
-            elif node.type == NodeType.IF_STMT:
-                print(f"node: {node}")
-                print(f"  IF statement: {node.left.value} {node.right.value} {node.else_node.value if node.else_node else 'None'}")
-                self._generate_if_statement(node)
-            elif node.type == NodeType.PROCESSOR_STMT:
-                print(f"  PROCESSOR statement: {node.left.value} {node.right.value}")
-                self._generate_processor_statement(node)
-            elif node.type == NodeType.WHILE_STMT:
-                print(f"  WHILE statement: {node.left.value} {node.right.value}")
-                self._generate_while_statement(node)
-            elif node.type == NodeType.ELSE_STMT:
-                print(f"  ELSE statement")
-                self._generate_else_statement(node)
-            elif node.type == NodeType.ASSIGN_STMT:
-                self._generate_assign_stmt(node)
-            elif node.type == NodeType.FUNCTION_CALL:
-                self._generate_function_call(node)
-            node = node.next_node
-
-        self.output.append("\n; System exit")
-        self.output.append("mov eax, 1    ; sys_exit")
-        self.output.append("int 0x80")
+        tracing = trace.codegen
+        for node in self.ast.body:
+            if tracing:
+                self._trace_statement(node)
+            self._generate_node(node)
+
+        # Falling off the end of the program exits too, unless it already ended in exit(...)
+        if not self.ast.body or self.ast.body[-1].type != NodeType.EXIT_STMT:
+            self.output.append("\n; System exit")
+            if self._prints:
+                self.output.append("call flush_output")
+            self.output.append("mov ebx, 0    ; exit status")
+            self.output.append("mov eax, 1    ; sys_exit")
+            self.output.append("int 0x80")
+        self.output.extend(runtime_routines(self.prints_integers, self.prints_strings))
 
         # Deduplicate section .data
-        if self.string_literals or self.variables:
+        if self.string_literals or self.variables.keys() - self.registers.keys():
             self.output.append("\nsection .data")
 
         # Output string literals
@@ -66,247 +99,479 @@ class CodeGenerator:
 
         # Output variable definitions with their initial values
         for var, val in self.variables.items():
+            if var in self.registers:
+                continue
             if var in self.initial_values:
                 self.output.append(f"{var}: dd {self.initial_values[var]}")
             else:
                 self.output.append(f"{var}: dd 0")
 
+        if self._prints:
+            self.output.append("\nsection .bss")
+            self.output.extend(OUTPUT_BSS)
         return "\n".join(self.output)
 
 
 
-    def _collect_variables(self, node: ASTNode):
-        """First pass to collect all variable declarations and their initial values"""
-        if not node:
+    def _trace_statement(self, node: ASTNode):
+        trace.log("codegen", f"Processing node: {node.type}")
+        if trace.codegen < 2:
             return
-        
         if node.type == NodeType.LET_STMT:
-            var_name = node.left.value
-            self.variables[var_name] = "dd 0"  # Pre-declare all variables
-            
-            # If the right side is an integer literal, store its value
-            if node.right and node.right.type == NodeType.INT_LIT:
-                self.initial_values[var_name] = node.right.value
-                print(f"Collected initial value for {var_name}: {node.right.value}")
-        
-        self._collect_variables(node.left)
-        self._collect_variables(node.right)
-        self._collect_variables(node.next_node)
-
-    def _generate_variable(self, node):
-        var_name = node.value
-        if var_name not in self.variables:
-            raise RuntimeError(f"Variable '{var_name}' used before declaration")
-        self.output.append(f"mov eax, [{var_name}]")
+            trace.log("codegen", f"  LET statement: {node.name} = {node.expr.type}")
+        elif node.type == NodeType.EXIT_STMT:
+            trace.log("codegen", f"  EXIT statement with arg: {node.arg.type if node.arg else 'None'}")
+        elif node.type == NodeType.IF_STMT:
+            trace.log("codegen", f"  IF statement: {node.condition.type} "
+                                 f"then: {len(node.then_body)} else: {len(node.else_body)}")
+        elif node.type == NodeType.WHILE_STMT:
+            trace.log("codegen", f"  WHILE statement: {node.condition.type} body: {len(node.body)}")
+
+    def _collect_variables(self, node: ASTNode):
+        """First pass to collect all variable declarations and their initial values, and what the program prints"""
+        for child, _ in walk(node):
+            if child.type == NodeType.PRINT_STMT:
+                if child.arg.type == NodeType.STRING_LIT:
+                    self.prints_strings = True
+                else:
+                    self.prints_integers = True
+            if child.type != NodeType.LET_STMT:
+                continue
+            self.variables[child.name] = "dd 0"  # Pre-declare all variables
+
+        # Optimization may rewrite or remove `let`s, so the values come from the tree it started with
+        seeds = self.seeds if self.seeds is not None else initial_values(node)
+        for var_name, value in seeds.items():
+            self.variables.setdefault(var_name, "dd 0")
+            if value:
+                self.initial_values[var_name] = value
+                if trace.codegen >= 2:
+                    trace.log("codegen", f"Collected initial value for {var_name}: {value}")
+
+    def _generate_node(self, node: ASTNode):
+        """Emit code for a node with an explicit work stack instead of recursion.
+
+        Each _generate_* method returns work items in emission order: strings are
+        emitted verbatim, AST nodes are expanded in turn, a list (a statement
+        body) has its statements expanded in order and a Branch emits a
+        conditional jump.
+        """
+        output = self.output
+        expand = self._expand_traced if trace.codegen >= 2 else self._expand
+        stack = [node]
+        while stack:
+            item = stack.pop()
+            if type(item) is str:
+                output.append(item)
+            elif type(item) is list:
+                stack.extend(reversed(item))
+            elif type(item) is Branch:
+                self._emit_expression(item, item.condition)
+            else:
+                stack.extend(reversed(expand(item)))
+
+    def _expand(self, node: ASTNode) -> list:
+        generate = self._generators.get(node.type)
+        if generate is None:
+            self._warn_unsupported(node)
+            return []
+        return generate(self, node)
+
+    def _warn_unsupported(self, node: ASTNode):
+        if node.type in self._unsupported:
+            return
+        self._unsupported.add(node.type)
+        self.diagnostics.append(Diagnostic(Diagnostic.WARNING,
+                                           f"{node.type.name} is not supported by the code generator and was skipped"))
+
+    def _expand_traced(self, node: ASTNode) -> list:
+        trace.log("codegen", f"  Generating node: {node.type}")
+        return self._expand(node)
+
+    def _location(self, var_name: str) -> str:
+        """The operand holding a variable: its register, or its memory slot."""
+        register = self.registers.get(var_name)
+        return register if register is not None else f"[{var_name}]"
 
     def _generate_let_statement(self, node: ASTNode):
-        var_name = node.left.value
-        
-        # Generate right-hand side first (e.g., mov eax, 2)
-        if node.right.type == NodeType.INT_LIT:
-            print(f"  Generating integer literal: {node.right.value}")
-            self.output.append(f"mov eax, {node.right.value}")
-        elif node.right.type == NodeType.VAR:
-            print(f"  Generating variable reference: {node.right.value}")
-            self._generate_variable(node.right)
-        elif node.right.type == NodeType.BINARY_OP:
-            print(f"  Generating binary operation")
-            self._generate_binary_op(node.right)
-        else:
-            print(f"  Generating other expression type: {node.right.type}")
-            self._generate_node(node.right)
-        
-        # Store the value in eax into the variable
-        print(f"  Storing value in variable: {var_name}")
-        self.output.append(f"mov [{var_name}], eax")
+        var_name = node.name
+
+        # Generate right-hand side first (e.g., mov eax, 2), then store eax into the variable
+        return [node.expr, f"mov {self._location(var_name)}, eax"]
 
     def _generate_assign_stmt(self, node):
-        var_name = node.left.value
-
-        # Generate right-hand side first (e.g., mov eax, x + 1)
-        if node.right.type == NodeType.INT_LIT:
-            self.output.append(f"mov eax, {node.right.value}")
-        elif node.right.type == NodeType.VAR:
-            self._generate_variable(node.right)
-        elif node.right.type == NodeType.BINARY_OP:
-            self._generate_binary_op(node.right)
-        else:
-            self._generate_node(node.right)
-        
-        # Store the value in eax into the variable
-        self.output.append(f"mov [{var_name}], eax")
+        var_name = node.name
+
+        # Generate right-hand side first (e.g., mov eax, x + 1), then store eax into the variable
+        return [node.expr, f"mov {self._location(var_name)}, eax"]
 
     def _generate_while_statement(self, node: ASTNode):
         start_label = f"start_while_{self.label_counter}"
         end_label = f"end_while_{self.label_counter}"
         self.label_counter += 1
-        
-        self.output.append(f"{start_label}:")
-        
-        # Generate condition
-        self._generate_node(node.left)
-        
-        # For comparison operators, we need to handle them specially
-        if hasattr(node.left, 'value') and node.left.value in ['>', '<', '>=', '<=', '==', '!=']:
-            # The condition is already evaluated, just check if it's non-zero
-            self.output.append("cmp eax, 0")
-        else:
-            # For other conditions, just check if the result is non-zero
-            self.output.append("cmp eax, 0")
-        
-        # Jump to end if condition is false
-        self.output.append(f"je {end_label}")
-        
-        # Generate loop body
-        if node.right:
-            self._generate_node(node.right)
-        
-        # Jump back to start
-        self.output.append(f"jmp {start_label}")
-        self.output.append(f"{end_label}:")
+
+        # Rotated into a guarded do-while: the test at the bottom jumps back while the condition
+        # holds, so an iteration costs one branch instead of a test and a jmp
+        return [Branch(node.condition, end_label, False), f"{start_label}:", node.body,
+                Branch(node.condition, start_label, True), f"{end_label}:"]
 
     def _generate_processor_statement(self, node: ASTNode):
         # TODO: Implement processor statement generation
-        pass
+        return []
 
     def _generate_function_call(self, node: ASTNode):
         """Generate assembly code for function calls"""
         # Save current registers
-        self.output.append("push rax")
-        self.output.append("push rbx")
-        self.output.append("push rcx")
-        self.output.append("push rdx")
-        
+        items = ["push rax", "push rbx", "push rcx", "push rdx"]
+
         # Generate arguments (reverse order for x86_64 calling convention)
         if node.args:
             for i, arg in enumerate(reversed(node.args)):
-                self._generate_node(arg)
-                if i == 0:
-                    self.output.append("mov rdi, rax")  # First arg in rdi
-                elif i == 1:
-                    self.output.append("mov rsi, rax")  # Second arg in rsi
-                elif i == 2:
-                    self.output.append("mov rdx, rax")  # Third arg in rdx
-                elif i == 3:
-                    self.output.append("mov rcx, rax")  # Fourth arg in rcx
-                elif i == 4:
-                    self.output.append("mov r8, rax")   # Fifth arg in r8
-                elif i == 5:
-                    self.output.append("mov r9, rax")   # Sixth arg in r9
+                items.append(arg)
+                if i < len(ARGUMENT_REGISTERS):
+                    items.append(f"mov {ARGUMENT_REGISTERS[i]}, rax")
                 else:
                     # Additional args go on stack
-                    self.output.append("push rax")
-        
+                    items.append("push rax")
+
         # Call the function
-        self.output.append(f"call {node.function_name}")
-        
+        items.append(f"call {node.function_name}")
+
         # Restore registers
-        self.output.append("pop rdx")
-        self.output.append("pop rcx")
-        self.output.append("pop rbx")
-        self.output.append("pop rax")
+        items.extend(["pop rdx", "pop rcx", "pop rbx", "pop rax"])
+        return items
 
     def _generate_if_statement(self, node: ASTNode):
-        print("Generating if statement")
-        
-        # Generate condition
-        self._generate_node(node.left)
-        
-        # For comparison operators, we need to handle them specially
-        if hasattr(node.left, 'value') and node.left.value in ['>', '<', '>=', '<=', '==', '!=']:
-            # The condition is already evaluated, just check if it's non-zero
-            self.output.append("cmp eax, 0")
-        else:
-            # For other conditions, just check if the result is non-zero
-            self.output.append("cmp eax, 0")
-        
         else_label = f"else_{self.label_counter}"
         end_label = f"end_if_{self.label_counter}"
         self.label_counter += 1
-        
-        # Jump to else block if condition is false
-        self.output.append(f"je {else_label}")
-        
-        # Generate then block
-        if node.right:
-            self._generate_node(node.right)
-        self.output.append(f"jmp {end_label}")
-        
+
+        if not node.else_body:
+            return [Branch(node.condition, end_label, False), node.then_body, f"{end_label}:"]
+
+        # Jump to else block if the condition is false
+        items = [Branch(node.condition, else_label, False), node.then_body, f"jmp {end_label}"]
+
         # Generate else block
-        self.output.append(f"{else_label}:")
-        if node.else_node:
-            self._generate_node(node.else_node)
-        
+        items.append(f"{else_label}:")
+        items.append(node.else_body)
+
         # End of if statement
-        self.output.append(f"{end_label}:")
+        items.append(f"{end_label}:")
+        return items
+
+    @property
+    def _prints(self) -> bool:
+        return self.prints_integers or self.prints_strings
 
     def _generate_exit_statement(self, node: ASTNode):
-        if node.left:
-            print(f"  Generating exit argument: {node.left.type}")
-            if node.left.type == NodeType.VAR:
-                self._generate_variable(node.left)
+        # Buffered output is written out first; the routine preserves the registers
+        items = ["call flush_output"] if self._prints else []
+        if node.arg:
+            items.append(node.arg)
+            items.append("mov ebx, eax  ; exit status")
+        else:
+            items.append("mov ebx, 0    ; exit status")
+        items.append("mov eax, 1    ; sys_exit")
+        items.append("int 0x80")
+        return items
+
+    def _generate_expression(self, node: ASTNode):
+        """Evaluate an expression into eax using the SCRATCH_REGISTERS.
+
+        Operands are ordered by their Sethi-Ullman numbers (the registers needed
+        to evaluate them), so the stack is used only when a subtree needs more
+        registers than are free. Literals and variables are used directly as
+        immediate, register or memory operands. The code is appended to the
+        output directly, which is where the work stack would put it anyway.
+        """
+        self._emit_expression((node, "eax", SCRATCH_SET), node)
+        return []
+
+    def _emit_expression(self, item, root: ASTNode):
+        """Emit an expression item or a Branch on the expression `root`."""
+        output = self.output
+        needs = self._register_needs(root)
+        stack = [item]
+        while stack:
+            item = stack.pop()
+            if type(item) is str:
+                output.append(item)
+            elif type(item) is Branch:
+                stack.extend(reversed(self._branch_items(item, needs)))
+            elif item[0].type in LEAF_TYPES:
+                output.append(f"mov {item[1]}, {self._operand(item[0])}")
             else:
-                self._generate_node(node.left)
-        self.output.append("mov ebx, eax  ; exit status")
+                stack.extend(reversed(self._expression_items(*item, needs)))
 
-    def _generate_node(self, node: ASTNode):
-        print(f"  Generating node: {node.type} {node.value}")
+    @staticmethod
+    def _register_needs(expr: ASTNode) -> dict:
+        """Sethi-Ullman number of every operator node, by id; a leaf needs one register."""
+        binary, unary = NodeType.BINARY_OP, NodeType.UNARY_OP
+        operators = []
+        stack = [expr]
+        while stack:
+            node = stack.pop()
+            node_type = node.type
+            if node_type is binary:
+                operators.append(node)
+                stack.append(node.left)
+                stack.append(node.right)
+            elif node_type is unary:
+                operators.append(node)
+                stack.append(node.operand)
+        needs = {}
+        get = needs.get
+        for node in reversed(operators):  # children before their parent
+            if node.type is binary:
+                left = get(id(node.left), 1)
+                right = get(id(node.right), 0 if node.right.type in LEAF_TYPES else 1)
+                needs[id(node)] = left + 1 if left == right else (left if left > right else right)
+            else:
+                needs[id(node)] = get(id(node.operand), 1)
+        return needs
+
+    def _operand(self, node: ASTNode) -> str:
+        """A literal or variable as an instruction operand."""
         if node.type == NodeType.INT_LIT:
-            self.output.append(f"mov eax, {node.value}")
-        elif node.type == NodeType.VAR:
-            self._generate_variable(node)
-        elif node.type == NodeType.BINARY_OP:
-            self._generate_binary_op(node)
-        elif node.type == NodeType.LET_STMT:
-            self._generate_let_statement(node)
-        elif node.type == NodeType.EXIT_STMT:
-            self._generate_exit_statement(node)
-        elif node.type == NodeType.PRINT_STMT:
-            self._generate_print_statement(node)
-        elif node.type == NodeType.ASSIGN_STMT:
-            self._generate_assign_stmt(node)
-        elif node.type == NodeType.IF_STMT:
-            self._generate_if_statement(node)
-        elif node.type == NodeType.WHILE_STMT:
-            self._generate_while_statement(node)
-        elif node.type == NodeType.FUNCTION_CALL:
-            self._generate_function_call(node)
-
-    def _generate_binary_op(self, node: ASTNode):
-        self._generate_node(node.right)
-        self.output.append("push eax")
-        self._generate_node(node.left)
-        self.output.append("pop ebx")
-
-        if node.value == '+':
-            self.output.append("add eax, ebx")
-        elif node.value == '-':
-            self.output.append("sub eax, ebx")
-        elif node.value == '*':
-            self.output.append("imul eax, ebx")
-        elif node.value == '/':
-            self.output.append("cdq")
-            self.output.append("idiv ebx")
-
-    def _generate_integer(self, node: ASTNode):
-        self.output.append(f"mov eax, {node.value}")
+            return str(node.value)
+        if node.name not in self.variables:
+            raise CodegenError(f"Variable '{node.name}' used before declaration")
+        return self._location(node.name)
 
-    def _generate_print_statement(self, node: ASTNode):
-        if node.left.type == NodeType.STRING_LIT:
-            label = self.add_string_literal(node.left.value)
-            length = len(node.left.value)
-
-            self.output.append(f"\n; print string: {node.left.value}")
-            self.output.append("mov eax, 4")  # sys_write
-            self.output.append("mov ebx, 1")  # stdout
-            self.output.append(f"mov ecx, {label}")
-            self.output.append(f"mov edx, {length}")
-            self.output.append("int 0x80")
+    def _expression_items(self, node: ASTNode, target: str, free: frozenset, needs: dict) -> list:
+        """Work items leaving node's value in target; only registers in free (target among them) may change."""
+        if node.type in LEAF_TYPES:
+            return [f"mov {target}, {self._operand(node)}"]
+        if node.type == NodeType.UNARY_OP:
+            items = [(node.operand, target, free)]
+            if node.op == '-':
+                items.append(f"neg {target}")
+            elif node.op == '!':
+                low = LOW_BYTE[target]
+                items += [f"test {target}, {target}", f"sete {low}", f"movzx {target}, {low}"]
+            return items
+        if node.type != NodeType.BINARY_OP:
+            self._warn_unsupported(node)
+            return []
+
+        if node.op in JUMP_IF:
+            items, op = self._compare_items(node, target, free, needs)
+            low = LOW_BYTE[target]
+            return items + [f"set{JUMP_IF[op][1:]} {low}", f"movzx {target}, {low}"]
+        if node.op == '&&' or node.op == '||':
+            false_label = f"false_{self.label_counter}"
+            end_label = f"end_bool_{self.label_counter}"
+            self.label_counter += 1
+            return [Branch(node, false_label, False, target, free), f"mov {target}, 1", f"jmp {end_label}",
+                    f"{false_label}:", f"mov {target}, 0", f"{end_label}:"]
+
+        reduction = self.reductions.get(id(node)) if self.reductions else None
+        if reduction is not None:
+            return [(getattr(node, reduction.operand), target, free)] + self._reduced(reduction, target, free)
+
+        items, operand, pushed = self._operand_items(node, target, free, needs)
+        if node.op == '/':
+            items += self._divide(target, operand, free, pushed)
         else:
-            # For integers, convert to string and print
-            self._generate_node(node.left)
-            # TODO: Add integer to string conversion and printing
-            self.output.append("; TODO: Add integer printing")
+            items.append(f"{ARITHMETIC_INSTRUCTIONS[node.op]} {target}, {operand}")
+            if pushed:
+                items.append("add esp, 4")
+        return items
+
+    def _operand_items(self, node: ASTNode, target: str, free: frozenset, needs: dict) -> tuple:
+        """Items putting a binary operator's left operand in target; returns them with the right operand.
+
+        The right operand is a literal or variable used directly, a spare
+        register, or the stack top when no register is spare; the last element
+        counts the dwords pushed for it.
+        """
+        left, right = node.left, node.right
+        if right.type in LEAF_TYPES:
+            return [(left, target, free)], self._operand(right), 0
+        if len(free) > 1:
+            spare = [register for register in SCRATCH_REGISTERS if register in free and register != target]
+            if node.op == '/':
+                spare.sort(key=lambda register: register in DIVISION_REGISTERS)  # keep the divisor out of eax:edx
+            other = spare[0]
+            if needs.get(id(left), 1) >= needs[id(right)]:
+                items = [(left, target, free), (right, other, free - {target})]
+            else:
+                items = [(right, other, free), (left, target, free - {other})]
+            return items, other, 0
+        # Out of registers: park the right operand on the stack
+        return [(right, target, free), f"push {target}", (left, target, free)], "dword [esp]", 1
+
+    def _compare_items(self, node: ASTNode, target: str, free: frozenset, needs: dict) -> tuple:
+        """Items setting the flags for a relational operator; returns them with the operator they test.
+
+        A variable compared with a literal or variable is compared in place; a
+        literal on the left swaps the operands (and the operator).
+        """
+        left, right, op = node.left, node.right, node.op
+        if left.type == NodeType.INT_LIT and right.type == NodeType.VAR:
+            left, right, op = right, left, SWAPPED[op]
+        if left.type == NodeType.VAR and right.type in LEAF_TYPES:
+            first, second = self._operand(left), self._operand(right)
+            if not (first[0] == '[' and second[0] == '['):
+                if first[0] == '[' and right.type == NodeType.INT_LIT:
+                    first = f"dword {first}"
+                return [f"cmp {first}, {second}"], op
+        items, operand, pushed = self._operand_items(node, target, free, needs)
+        items.append(f"cmp {target}, {operand}")
+        if pushed:
+            items.append("lea esp, [esp + 4]")  # unlike add, keeps the flags
+        return items, node.op
+
+    def _branch_items(self, branch: Branch, needs: dict) -> list:
+        """Compare-and-jump items for a Branch; && and || become chains of jumps that skip the right side."""
+        node, label, when = branch.condition, branch.label, branch.when
+        target, free = branch.target, branch.free
+        if node.type == NodeType.INT_LIT:
+            return [f"jmp {label}"] if (node.value != 0) == when else []
+        if node.type == NodeType.UNARY_OP and node.op == '!':
+            return [Branch(node.operand, label, not when, target, free)]
+        if node.type == NodeType.BINARY_OP:
+            op = node.op
+            if op == '&&' or op == '||':
+                if (op == '||') == when:
+                    # either side alone decides: false for &&, true for ||
+                    return [Branch(node.left, label, when, target, free), Branch(node.right, label, when, target, free)]
+                skip_label = f"skip_{self.label_counter}"
+                self.label_counter += 1
+                return [Branch(node.left, skip_label, not when, target, free),
+                        Branch(node.right, label, when, target, free), f"{skip_label}:"]
+            if op in JUMP_IF:
+                items, op = self._compare_items(node, target, free, needs)
+                return items + [f"{JUMP_IF[op if when else NEGATED[op]]} {label}"]
+        jump = "jne" if when else "je"
+        if node.type == NodeType.VAR:
+            location = self._operand(node)
+            test = f"cmp dword {location}, 0" if location[0] == '[' else f"test {location}, {location}"
+            return [test, f"{jump} {label}"]
+        return [(node, target, free), f"test {target}, {target}", f"{jump} {label}"]
+
+    def _divide(self, target: str, divisor: str, free: frozenset, pushed: int) -> list:
+        """target = target / divisor with idiv, which needs the dividend in eax and clobbers edx.
+
+        An immediate divisor, or one sitting in eax or edx, is moved to a free
+        register or the stack first; eax and edx are saved around the division
+        when they hold live values.
+        """
+        items = []
+        on_stack = pushed > 0
+        if not on_stack and (divisor in DIVISION_REGISTERS or divisor.lstrip('-').isdigit()):
+            safe = [register for register in SCRATCH_REGISTERS
+                    if register in free and register != target and register not in DIVISION_REGISTERS]
+            if safe:
+                items.append(f"mov {safe[0]}, {divisor}")
+                divisor = safe[0]
+            else:
+                items.append(f"push {divisor}")
+                pushed += 1
+                on_stack = True
+        saved = [register for register in DIVISION_REGISTERS if register not in free]
+        items += [f"push {register}" for register in saved]
+        if on_stack:
+            divisor = f"dword [esp + {4 * len(saved)}]" if saved else "dword [esp]"
+        elif divisor.startswith('['):
+            divisor = f"dword {divisor}"
+        if target != "eax":
+            items.append(f"mov eax, {target}")
+        items += ["cdq", f"idiv {divisor}"]
+        if target != "eax":
+            items.append(f"mov {target}, eax")
+        items += [f"pop {register}" for register in reversed(saved)]
+        if pushed:
+            items.append(f"add esp, {4 * pushed}")
+        return items
+
+    def _reduced(self, reduction: Reduction, target: str, free: frozenset) -> list:
+        """Multiply or divide target by a literal as strength_reduction.py decided, without imul or idiv."""
+        if reduction.kind == Reduction.MULTIPLY:
+            items = []
+            for step in reduction.steps:
+                if step[0] == "lea":
+                    items.append(f"lea {target}, [{target} + {target}*{step[1] - 1}]")
+                elif step[0] == "shl":
+                    items.append(f"shl {target}, {step[1]}")
+                else:
+                    items.append(f"neg {target}")
+            return items
+
+        if reduction.kind == Reduction.POWER_OF_TWO:
+            # Add 2**shift - 1 to negative dividends so the shift rounds toward zero
+            shift = reduction.shift
+            spare, borrow, give_back = self._borrow(target, free, ())
+            items = borrow + [f"mov {spare}, {target}"]
+            if shift > 1:
+                items.append(f"sar {spare}, 31")
+            items += [f"shr {spare}, {32 - shift}", f"add {target}, {spare}", f"sar {target}, {shift}"] + give_back
+            if reduction.negate:
+                items.append(f"neg {target}")
+            return items
+
+        # The high half of dividend * magic (one-operand imul, like idiv, uses eax and edx),
+        # shifted, plus one for negative quotients to round toward zero
+        saved = [register for register in DIVISION_REGISTERS if register not in free]
+        items = [f"push {register}" for register in saved]
+        source, give_back = target, []
+        if reduction.add_dividend and target in DIVISION_REGISTERS:
+            source, borrow, give_back = self._borrow(target, free, DIVISION_REGISTERS)
+            items += borrow + [f"mov {source}, {target}"]
+        if source == "eax":
+            items += [f"mov edx, {reduction.magic}", "imul edx"]
+        else:
+            items += [f"mov eax, {reduction.magic}", f"imul {source}"]
+        if reduction.add_dividend:
+            items.append(f"add edx, {source}")
+        if reduction.shift:
+            items.append(f"sar edx, {reduction.shift}")
+        items += ["mov eax, edx", "shr eax, 31", "add edx, eax"]
+        if reduction.negate:
+            items.append("neg edx")
+        if target != "edx":
+            items.append(f"mov {target}, edx")
+        return items + give_back + [f"pop {register}" for register in reversed(saved)]
+
+    @staticmethod
+    def _borrow(target: str, free: frozenset, exclude) -> tuple:
+        """A scratch register other than target and exclude, with the items saving and restoring it if it is live."""
+        candidates = [register for register in SCRATCH_REGISTERS if register != target and register not in exclude]
+        for register in candidates:
+            if register in free:
+                return register, [], []
+        return candidates[0], [f"push {candidates[0]}"], [f"pop {candidates[0]}"]
+
+    def _generate_print_statement(self, node: ASTNode):
+        if node.arg.type == NodeType.STRING_LIT:
+            label = self.add_string_literal(node.arg.value)
+            length = len(node.arg.value)
+
+            # The text and the newline after it go into the output buffer
+            return [
+                f"\n; print string: {node.arg.value}",
+                f"mov ecx, {label}",
+                f"mov edx, {length + 1}",
+                "call print_string",
+            ]
+        # Integers are converted to decimal by the runtime
+        return [node.arg, "call print_int"]
+
+    _generators = {
+        NodeType.INT_LIT: _generate_expression,
+        NodeType.VAR: _generate_expression,
+        NodeType.BINARY_OP: _generate_expression,
+        NodeType.UNARY_OP: _generate_expression,
+        NodeType.LET_STMT: _generate_let_statement,
+        NodeType.EXIT_STMT: _generate_exit_statement,
+        NodeType.PRINT_STMT: _generate_print_statement,
+        NodeType.ASSIGN_STMT: _generate_assign_stmt,
+        NodeType.IF_STMT: _generate_if_statement,
+        NodeType.WHILE_STMT: _generate_while_statement,
+        NodeType.PROCESSOR_STMT: _generate_processor_statement,
+        NodeType.FUNCTION_CALL: _generate_function_call,
+    }
 
     def add_string_literal(self, text):
         label = f"msg_{self.num_string_literals}"
@@ -315,5 +580,6 @@ class CodeGenerator:
         return label
 
     def write_to_file(self, filename: str):
+        code = self.generate_code()  # before opening, so a failed compile leaves no truncated file
         with open(filename, 'w') as f:
-            f.write(self.generate_code())
+            f.write(code)
@@ -0,0 +1,140 @@
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+from typing import Optional
+
+from options import DEFAULT_UNROLL_FACTOR, OPT_LEVELS, CompileOptions, check_pass_names, parse_pass_flags
+from paths import expand_inputs, output_paths
+
+SERVER_SOCKET_ENV_VAR = "CASSAVA_SERVER_SOCKET"
+
+
+def default_socket_path() -> str:
+    """$CASSAVA_SERVER_SOCKET, else a per-user socket in the runtime (or temp) directory."""
+    path = os.environ.get(SERVER_SOCKET_ENV_VAR)
+    if path:
+        return path
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(runtime_dir, f"cassava-{os.getuid()}.sock")
+
+
+class CompileClient:
+    """Connection to a compile server; one JSON object per line in each direction.
+
+    Kept to the standard library, options.py and paths.py so starting a client costs no more
+    than the interpreter itself; the compiler proper stays loaded in the server.
+    """
+
+    def __init__(self, socket_path: Optional[str] = None):
+        self.socket_path = socket_path or default_socket_path()
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._socket.connect(self.socket_path)
+        except OSError:
+            self._socket.close()
+            raise
+        self._file = self._socket.makefile("rwb")
+
+    def request(self, message: dict) -> dict:
+        self._file.write(json.dumps(message).encode() + b"\n")
+        self._file.flush()
+        reply = self._file.readline()
+        if not reply:
+            raise ConnectionError("compile server closed the connection")
+        return json.loads(reply)
+
+    def compile(self, input_file: str, output_file: str, options: Optional[dict] = None) -> dict:
+        """Compile input_file to output_file on the server.
+
+        Returns the reply: {"ok": bool, "error": message or None, "warnings": [message, ...]}; a
+        request the server rejects gets "ok" false and the reason in "error".
+        """
+        message = {"command": "compile", "input": os.path.abspath(input_file), "output": os.path.abspath(output_file)}
+        if options:
+            message["options"] = options
+        return self.request(message)
+
+    def stats(self) -> dict:
+        return self.request({"command": "stats"})["stats"]
+
+    def shutdown(self):
+        self.request({"command": "shutdown"})
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Compile source files on a running compile server.")
+    arg_parser.add_argument("inputs", nargs="*", metavar="input", help="source files or glob patterns")
+    arg_parser.add_argument("-o", "--output", help="output file for a single input (default: output.asm)")
+    arg_parser.add_argument("--out-dir", help="write <name>.asm for each input into this directory")
+    arg_parser.add_argument("-O", dest="opt_level", type=int, choices=OPT_LEVELS, default=0,
+                            help="optimization level (as for main.py)")
+    arg_parser.add_argument("-f", dest="pass_flags", action="append", default=[], metavar="[no-]PASS",
+                            help="turn an optimization pass on or off (as for main.py)")
+    arg_parser.add_argument("--unroll-factor", type=int, default=DEFAULT_UNROLL_FACTOR, metavar="N",
+                            help="iterations per trip of a partially unrolled loop (as for main.py)")
+    arg_parser.add_argument("--socket", default=default_socket_path(),
+                            help=f"server socket (default: ${SERVER_SOCKET_ENV_VAR} or a per-user path)")
+    arg_parser.add_argument("--stats", action="store_true", help="print the server's cache statistics")
+    arg_parser.add_argument("--shutdown", action="store_true", help="stop the server after this request")
+    args = arg_parser.parse_args()
+    if args.unroll_factor < 1:
+        arg_parser.error("--unroll-factor must be at least 1")
+    enable, disable = parse_pass_flags(args.pass_flags)
+    try:
+        check_pass_names(enable | disable)
+    except ValueError as error:
+        arg_parser.error(str(error))
+    options = CompileOptions(opt_level=args.opt_level, enable=enable, disable=disable,
+                             unroll_factor=args.unroll_factor).as_dict()
+
+    try:
+        inputs = expand_inputs(args.inputs)
+        outputs = output_paths(inputs, args.output, args.out_dir) if inputs else []
+    except ValueError as error:
+        arg_parser.error(str(error))
+    if args.out_dir is not None:
+        os.makedirs(args.out_dir, exist_ok=True)
+
+    try:
+        client = CompileClient(args.socket)
+    except OSError as error:
+        sys.stderr.write(f"cannot reach compile server at {args.socket}: {error.strerror}\n"
+                         f"start one with: python compile_server.py --socket {args.socket}\n")
+        sys.exit(1)
+
+    failed = 0
+    with client:
+        for input_file, output_file in zip(inputs, outputs):
+            reply = client.compile(input_file, output_file, options)
+            for warning in reply.get("warnings", []):
+                sys.stderr.write(f"{input_file}: warning: {warning}\n")
+            if not reply["ok"]:
+                failed += 1
+                sys.stderr.write(f"{input_file}: error: {reply['error']}\n")
+        if args.stats:
+            for namespace, stats in client.stats().items():
+                sys.stderr.write(f"{namespace} cache: {stats['hits']} hits, {stats['misses']} misses, "
+                                 f"{stats['writes']} writes, {stats['evictions']} evictions\n")
+        if args.shutdown:
+            client.shutdown()
+    if len(inputs) > 1:
+        sys.stderr.write(f"compiled {len(inputs) - failed} of {len(inputs)} files\n")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
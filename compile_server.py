@@ -0,0 +1,143 @@
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+from typing import Optional
+
+# Loaded up front so that no request pays for importing the compiler.
+import ast_cache  # noqa: F401
+import code_generator  # noqa: F401
+from batch import run_job
+from cache import (AST_CACHE_NAMESPACE, CACHE_DIR_ENV_VAR, DEFAULT_MAX_BYTES, DEFAULT_MEMORY_MAX_BYTES,
+                   OUTPUT_CACHE_NAMESPACE, DiskCache, MemoryCache, compiler_version)
+from compile_client import SERVER_SOCKET_ENV_VAR, default_socket_path
+from options import CompileOptions, check_pass_names
+from tracing import trace, PHASES, TRACE_ENV_VAR
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Serves one client connection: a JSON request per line, answered by a JSON reply per line."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                reply = self.server.handle_message(json.loads(line))
+            except (ValueError, KeyError, TypeError) as error:
+                reply = {"ok": False, "error": f"bad request: {error}", "warnings": []}
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+
+class CompileServer(socketserver.ThreadingUnixStreamServer):
+    """Long-lived compiler listening on a Unix domain socket.
+
+    Every connection gets its own thread. Requests name an input and an output path
+    (absolute, since the server's working directory is not the client's) and
+    options as a dict; the server compiles with its in-memory caches, which sit in
+    front of the on-disk caches when a cache directory is given.
+
+    Commands: {"command": "compile", "input": ..., "output": ..., "options": {...}},
+    {"command": "stats"} and {"command": "shutdown"}.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, cache_dir: Optional[str] = None,
+                 cache_max_bytes: int = DEFAULT_MAX_BYTES, memory_max_bytes: int = DEFAULT_MEMORY_MAX_BYTES):
+        self.socket_path = socket_path
+        caches = []
+        for namespace in (OUTPUT_CACHE_NAMESPACE, AST_CACHE_NAMESPACE):
+            backing = DiskCache(cache_dir, namespace, cache_max_bytes) if cache_dir else None
+            caches.append(MemoryCache(namespace, memory_max_bytes, backing))
+        self.output_cache, self.ast_cache = caches
+        compiler_version()  # hash the compiler sources now rather than on the first request
+
+        _remove_stale_socket(socket_path)
+        old_umask = os.umask(0o077)  # only this user may connect
+        try:
+            super().__init__(socket_path, _RequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def handle_message(self, message: dict) -> dict:
+        command = message.get("command", "compile")
+        if command == "compile":
+            options = CompileOptions.from_dict(message.get("options", {}))
+            check_pass_names(options.enable | options.disable)
+            result = run_job(message["input"], message["output"], options, self.output_cache, self.ast_cache)
+            if trace.cache >= 2:
+                trace.log("cache", f"served {message['input']}: {'ok' if result.ok else result.error}")
+            return {"ok": result.ok, "error": result.error, "warnings": result.warnings}
+        if command == "stats":
+            stats = {}
+            for cache in (self.output_cache, self.ast_cache):
+                stats[cache.namespace] = cache.stats.as_dict()
+                if cache.backing is not None:
+                    stats[f"{cache.namespace} disk"] = cache.backing.stats.as_dict()
+            return {"ok": True, "stats": stats, "warnings": []}
+        if command == "shutdown":
+            # shutdown() waits for serve_forever to return, so it cannot run on a handler thread's own request
+            threading.Thread(target=self.shutdown).start()
+            return {"ok": True, "warnings": []}
+        return {"ok": False, "error": f"unknown command '{command}'", "warnings": []}
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+
+def _remove_stale_socket(socket_path: str):
+    """Remove a socket file left behind by a dead server; refuse to replace a live one."""
+    if not os.path.exists(socket_path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except ConnectionRefusedError:
+        os.unlink(socket_path)
+        return
+    finally:
+        probe.close()
+    raise OSError(f"a compile server is already listening on {socket_path}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Run a compile server on a Unix domain socket.")
+    arg_parser.add_argument("--socket", default=default_socket_path(),
+                            help=f"socket path (default: ${SERVER_SOCKET_ENV_VAR} or a per-user path)")
+    arg_parser.add_argument("--cache-dir", default=os.environ.get(CACHE_DIR_ENV_VAR),
+                            help=f"back the in-memory caches with this directory (default: ${CACHE_DIR_ENV_VAR})")
+    arg_parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                            help="size cap of each on-disk cache")
+    arg_parser.add_argument("--memory-cache-mb", type=int, default=DEFAULT_MEMORY_MAX_BYTES // (1024 * 1024),
+                            help="size cap of each in-memory cache")
+    arg_parser.add_argument("--trace", metavar="SPEC",
+                            help=f"trace compiler phases (phases: all, {', '.join(PHASES)}; overrides ${TRACE_ENV_VAR})")
+    args = arg_parser.parse_args()
+    if args.trace is not None:
+        try:
+            trace.configure(args.trace)
+        except ValueError as error:
+            arg_parser.error(f"--trace: {error}")
+
+    try:
+        server = CompileServer(args.socket, args.cache_dir, args.cache_max_mb * 1024 * 1024,
+                               args.memory_cache_mb * 1024 * 1024)
+    except OSError as error:
+        sys.stderr.write(f"cannot listen on {args.socket}: {error}\n")
+        sys.exit(1)
+    with server:
+        sys.stderr.write(f"compile server listening on {args.socket}\n")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import marshal
+import mmap
+from collections import Counter
+from typing import List, Optional, Union
+
+from cache import Cache, buffer_digest, compiler_version, content_key
+from errors import Diagnostic
+from options import CompileOptions
+from timing import PhaseTimer, count_instructions, phase
+from tracing import trace
+
+# The parser and code generator are imported inside compile_source, after the output
+# cache lookup, so a cache hit never pays for loading them.
+
+
+class CompileResult:
+    """Assembly produced for one source, with its warnings and some statistics.
+
+    stats holds source_bytes, asm_lines and cached (whether the output cache
+    answered without compiling), plus passes (per-pass change counts) when an
+    optimization pass changed something.
+    """
+
+    __slots__ = ("asm", "diagnostics", "stats")
+
+    def __init__(self, asm: str, diagnostics: List[Diagnostic], stats: dict):
+        self.asm = asm
+        self.diagnostics = diagnostics
+        self.stats = stats
+
+
+def compile_source(source: Union[str, bytes, memoryview], options: Optional[CompileOptions] = None,
+                   output_cache: Optional[Cache] = None, ast_cache: Optional[Cache] = None,
+                   name: str = "<source>", timer: Optional[PhaseTimer] = None) -> CompileResult:
+    """Compile source text to assembly entirely in memory.
+
+    `source` may be str or any bytes-like buffer (bytes, memoryview, mmap); buffers
+    are lexed in place. Errors in the program raise CompileError subclasses. The
+    output cache, when given, is consulted first and then the AST cache; `name`
+    only appears in traces. A PhaseTimer collects per-phase timings and counts of
+    tokens, AST nodes by type and emitted instructions.
+    """
+    if options is None:
+        options = CompileOptions()
+    if isinstance(source, str):
+        source = source.encode()
+
+    source_digest = None
+    output_key = None
+    if output_cache is not None:
+        with phase(timer, "output_cache"):
+            source_digest = buffer_digest(source)
+            output_key = content_key(source_digest, options.cache_token(), compiler_version())
+            entry = output_cache.get(output_key)
+        if entry is not None:
+            if trace.cache:
+                trace.log("cache", f"output hit for {name}")
+            asm, diagnostics = marshal.loads(entry)
+            return _result(source, asm, [Diagnostic(*diagnostic) for diagnostic in diagnostics], True)
+        if trace.cache:
+            trace.log("cache", f"output miss for {name}")
+
+    from ast_cache import parse_source
+    from code_generator import CodeGenerator
+    from passes import run_asm_passes, run_passes
+
+    # Step 1 + 2: Lexical analysis streams tokens straight into the parser (skipped on a cache hit)
+    ast = parse_source(source, ast_cache, source_digest, name, timer)
+
+    # Step 3: Output the AST, and count its nodes, before the passes rewrite it
+    if trace.parse:
+        from ast_lib import print_ast
+        trace.log("parse", f"Generated AST for {name}:")
+        print_ast(ast, file=trace.stream)
+    if timer is not None:
+        from ast_lib import walk
+        timer.counts["ast_nodes"] = dict(Counter(node.type.name for node, _ in walk(ast)))
+
+    ast, context = run_passes(ast, options, timer)
+
+    generator = CodeGenerator(ast, context.registers, context.reductions, context.initial_values)
+    asm = run_asm_passes(generator.generate_code(timer), context, timer)
+    diagnostics = context.diagnostics + generator.diagnostics
+    if output_cache is not None:
+        entry = [(diagnostic.severity, diagnostic.message) for diagnostic in diagnostics]
+        with phase(timer, "output_cache"):
+            output_cache.put(output_key, marshal.dumps((asm, entry)))
+
+    if timer is not None:
+        timer.counts["instructions"] = count_instructions(asm)
+
+    result = _result(source, asm, diagnostics, False)
+    if context.stats:
+        result.stats["passes"] = context.stats
+    return result
+
+
+def _result(source, asm: str, diagnostics: List[Diagnostic], cached: bool) -> CompileResult:
+    stats = {"source_bytes": len(source), "asm_lines": asm.count("\n") + 1, "cached": cached}
+    return CompileResult(asm, diagnostics, stats)
+
+
+def compile_file(input_file: str, output_file: str, options: Optional[CompileOptions] = None,
+                 output_cache: Optional[Cache] = None, ast_cache: Optional[Cache] = None,
+                 timer: Optional[PhaseTimer] = None) -> CompileResult:
+    """Compile a source file to an assembly file via compile_source, lexing the file through mmap.
+
+    Nothing is written for a file that fails to compile.
+    """
+    with open(input_file, "rb") as file:
+        try:
+            source = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty files cannot be mapped
+            source = b""
+        try:
+            result = compile_source(source, options, output_cache, ast_cache, input_file, timer)
+        finally:
+            if isinstance(source, mmap.mmap):
+                source.close()
+    with phase(timer, "write"), open(output_file, "w") as file:
+        file.write(result.asm)
+    return result
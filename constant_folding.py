@@ -0,0 +1,253 @@
+from typing import Dict, Iterator, List, Optional
+
+from ast_lib import (ASTNode, AssignStmt, BinaryOp, ExitStmt, FunctionCall, IfStmt, IntLit, LetStmt, PrintStmt,
+                     ProcessorStmt, Program, StringLit, UnaryOp, Var, WhileStmt, walk)
+
+INT_MIN = -2 ** 31
+
+
+def wrap32(value: int) -> int:
+    """Reduce to a signed 32-bit value, wrapping around like the target's registers."""
+    value &= 0xFFFFFFFF
+    return value - 0x100000000 if value & 0x80000000 else value
+
+
+def evaluate_binary(op: str, left: int, right: int) -> Optional[int]:
+    """The value `left op right` has on the target, or None if evaluating it traps.
+
+    Arithmetic wraps at 32 bits and division truncates toward zero like idiv, which
+    faults on a zero divisor and on INT_MIN / -1. Comparisons and logical operators
+    give 0 or 1.
+    """
+    left, right = wrap32(left), wrap32(right)
+    if op == "+":
+        return wrap32(left + right)
+    if op == "-":
+        return wrap32(left - right)
+    if op == "*":
+        return wrap32(left * right)
+    if op == "/":
+        if right == 0 or (left == INT_MIN and right == -1):
+            return None
+        quotient = abs(left) // abs(right)
+        return wrap32(quotient if (left < 0) == (right < 0) else -quotient)
+    if op == "<":
+        return int(left < right)
+    if op == "<=":
+        return int(left <= right)
+    if op == ">":
+        return int(left > right)
+    if op == ">=":
+        return int(left >= right)
+    if op == "==":
+        return int(left == right)
+    if op == "!=":
+        return int(left != right)
+    if op == "&&":
+        return int(left != 0 and right != 0)
+    if op == "||":
+        return int(left != 0 or right != 0)
+    return None
+
+
+def evaluate_unary(op: str, operand: int) -> Optional[int]:
+    if op == "-":
+        return wrap32(-operand)
+    if op == "!":
+        return int(wrap32(operand) == 0)
+    return None
+
+
+def may_trap(expr: ASTNode) -> bool:
+    """Whether evaluating the expression could fault, i.e. it divides by something not known to be safe."""
+    for node, _ in walk(expr):
+        if type(node) is BinaryOp and node.op == "/":
+            divisor = node.right
+            if type(divisor) is not IntLit or wrap32(divisor.value) in (0, -1):
+                return True
+    return False
+
+
+class ExpressionFolder:
+    """Folds constant subexpressions, substituting known variable values from `env`.
+
+    Works bottom-up on an explicit stack, so left-leaning chains like
+    1 + 2 + ... + n thousands of terms long fold without recursion.
+    """
+
+    def __init__(self, context, pass_name: str):
+        self.context = context
+        self.pass_name = pass_name
+
+    def fold(self, expr: ASTNode, env: Dict[str, int]) -> ASTNode:
+        results = []
+        stack = [(expr, False)]
+        while stack:
+            node, children_done = stack.pop()
+            cls = type(node)
+            if cls is BinaryOp:
+                if not children_done:
+                    stack.append((node, True))
+                    stack.append((node.right, False))
+                    stack.append((node.left, False))
+                    continue
+                node.right = results.pop()
+                node.left = results.pop()
+                results.append(self._fold_binary(node))
+            elif cls is UnaryOp:
+                if not children_done:
+                    stack.append((node, True))
+                    stack.append((node.operand, False))
+                    continue
+                node.operand = results.pop()
+                results.append(self._fold_unary(node))
+            elif cls is Var and node.name in env:
+                self.context.count(self.pass_name, "propagated")
+                results.append(IntLit(env[node.name]))
+            else:
+                results.append(node)
+        return results[0]
+
+    def _fold_binary(self, node: BinaryOp) -> ASTNode:
+        op, left, right = node.op, node.left, node.right
+        left_value = left.value if type(left) is IntLit else None
+        right_value = right.value if type(right) is IntLit else None
+
+        if op == "/" and right_value is not None and wrap32(right_value) == 0:
+            self.context.warn("division by zero; it will fault at run time")
+            return node
+        if left_value is not None and right_value is not None:
+            value = evaluate_binary(op, left_value, right_value)
+            if value is None:
+                self.context.warn(f"'{wrap32(left_value)} {op} {wrap32(right_value)}' overflows and will fault "
+                                  f"at run time")
+                return node
+            return self._folded(IntLit(value))
+
+        # One constant operand: short circuits and identities that keep the other side's evaluation
+        if left_value is not None:
+            if op == "&&" and wrap32(left_value) == 0:
+                return self._folded(IntLit(0))
+            if op == "||" and wrap32(left_value) != 0:
+                return self._folded(IntLit(1))
+            if (op == "+" and wrap32(left_value) == 0) or (op == "*" and wrap32(left_value) == 1):
+                return self._folded(right)
+            if op == "*" and wrap32(left_value) == 0 and not may_trap(right):
+                return self._folded(IntLit(0))
+        if right_value is not None:
+            if op in ("+", "-") and wrap32(right_value) == 0:
+                return self._folded(left)
+            if op in ("*", "/") and wrap32(right_value) == 1:
+                return self._folded(left)
+            if op == "*" and wrap32(right_value) == 0 and not may_trap(left):
+                return self._folded(IntLit(0))
+        return node
+
+    def _fold_unary(self, node: UnaryOp) -> ASTNode:
+        if type(node.operand) is IntLit:
+            return self._folded(IntLit(evaluate_unary(node.op, node.operand.value)))
+        return node
+
+    def _folded(self, node: ASTNode) -> ASTNode:
+        self.context.count(self.pass_name, "folded")
+        return node
+
+
+def _statements(program: Program) -> Iterator[ASTNode]:
+    """Every statement in the program, nested bodies included."""
+    stack = [program.body]
+    while stack:
+        for statement in stack.pop():
+            yield statement
+            if type(statement) is IfStmt:
+                stack.append(statement.then_body)
+                stack.append(statement.else_body)
+            elif type(statement) is WhileStmt:
+                stack.append(statement.body)
+
+
+def fold_constants(program: Program, context) -> Program:
+    """Evaluate operators whose operands are literals, without tracking variables."""
+    folder = ExpressionFolder(context, "constant-folding")
+    empty = {}
+    for statement in _statements(program):
+        _fold_fields(statement, folder, empty)
+    return program
+
+
+def _fold_fields(statement: ASTNode, folder: ExpressionFolder, env: Dict[str, int]):
+    cls = type(statement)
+    if cls is LetStmt or cls is AssignStmt:
+        statement.expr = folder.fold(statement.expr, env)
+    elif cls is IfStmt or cls is WhileStmt:
+        statement.condition = folder.fold(statement.condition, env)
+    elif cls is PrintStmt:
+        if type(statement.arg) is not StringLit:
+            statement.arg = folder.fold(statement.arg, env)
+    elif cls is ExitStmt:
+        if statement.arg is not None:
+            statement.arg = folder.fold(statement.arg, env)
+    elif cls is FunctionCall:
+        statement.args = [folder.fold(arg, env) for arg in statement.args]
+
+
+def propagate_constants(program: Program, context) -> Program:
+    """Forward constant propagation over the structured program, folding as it goes.
+
+    The state maps variables to their known 32-bit values. An assignment of a
+    constant records it and any other assignment forgets it. At an `if` the two
+    branches' states are intersected, and only the taken branch counts when the
+    condition is constant. A `while` loop's head state keeps only the variables
+    the loop never assigns, which is the fixpoint of merging the entry state with
+    every iteration's exit state without re-analysing nested loops; that state
+    also holds after the loop. A call may write any variable, so it clears the state.
+    """
+    declared = {node.name for node, _ in walk(program) if type(node) is LetStmt}
+    folder = ExpressionFolder(context, "constant-propagation")
+    _propagate_block(program.body, {}, folder, declared)
+    return program
+
+
+def _propagate_block(statements: List[ASTNode], env: Dict[str, int], folder: ExpressionFolder,
+                     declared) -> Dict[str, int]:
+    for statement in statements:
+        cls = type(statement)
+        if cls is LetStmt or cls is AssignStmt:
+            statement.expr = folder.fold(statement.expr, env)
+            if type(statement.expr) is IntLit and statement.name in declared:
+                env[statement.name] = wrap32(statement.expr.value)
+            else:
+                env.pop(statement.name, None)
+        elif cls is IfStmt:
+            statement.condition = folder.fold(statement.condition, env)
+            if type(statement.condition) is IntLit:
+                taken, skipped = ((statement.then_body, statement.else_body) if statement.condition.value != 0
+                                  else (statement.else_body, statement.then_body))
+                _propagate_block(skipped, dict(env), folder, declared)  # never runs; fold it all the same
+                env = _propagate_block(taken, env, folder, declared)
+            else:
+                then_env = _propagate_block(statement.then_body, dict(env), folder, declared)
+                else_env = _propagate_block(statement.else_body, env, folder, declared)
+                env = {name: value for name, value in then_env.items() if else_env.get(name) == value}
+        elif cls is WhileStmt:
+            assigned = set()
+            calls = False
+            for node, _ in walk(statement):
+                if type(node) is LetStmt or type(node) is AssignStmt:
+                    assigned.add(node.name)
+                elif type(node) is FunctionCall:
+                    calls = True
+            head = {} if calls else {name: value for name, value in env.items() if name not in assigned}
+            statement.condition = folder.fold(statement.condition, head)
+            never_runs = type(statement.condition) is IntLit and statement.condition.value == 0
+            _propagate_block(statement.body, dict(head), folder, declared)
+            if not never_runs:
+                env = head
+        elif cls is FunctionCall:
+            _fold_fields(statement, folder, env)
+            env = {}
+        elif cls is ProcessorStmt:
+            continue  # not emitted by the code generator
+        else:
+            _fold_fields(statement, folder, env)
+    return env
@@ -0,0 +1,145 @@
+from typing import List, Optional, Set, Tuple
+
+from ast_lib import (ASTNode, AssignStmt, ExitStmt, FunctionCall, IfStmt, IntLit, LetStmt, PrintStmt, Program,
+                     StringLit, Var, WhileStmt, walk)
+from constant_folding import may_trap, wrap32
+
+PASS_NAME = "dead-code-elimination"
+
+
+def eliminate_dead_code(program: Program, context) -> Program:
+    """Remove code that cannot run and stores whose value is never read.
+
+    First a forward sweep drops what follows an exit (or an if whose branches
+    both exit, or a `while` whose condition is a non-zero constant), replaces an
+    if with a constant condition by the branch it takes and removes loops whose
+    condition is constant zero. Then a backward liveness sweep drops stores to
+    variables that are not read before being overwritten or the program ends;
+    a variable left with no stores and no reads loses its `let` too, and with it
+    its slot in the data section. Expressions that may fault are kept, so a
+    division by zero still traps where it did.
+    """
+    program.body, _ = _prune_block(program.body, context)
+    dead_lets = set()
+    _sweep_block(program.body, set(), dead_lets, context)
+    if dead_lets:
+        _remove_unused_lets(program, dead_lets, context)
+    return program
+
+
+def _constant(expr: ASTNode) -> Optional[int]:
+    return wrap32(expr.value) if type(expr) is IntLit else None
+
+
+def _uses(expr: Optional[ASTNode]) -> Set[str]:
+    return {node.name for node, _ in walk(expr) if type(node) is Var}
+
+
+def _prune_block(statements: List[ASTNode], context) -> Tuple[List[ASTNode], bool]:
+    """The reachable statements of a block, and whether control never falls off its end."""
+    result = []
+    for index, statement in enumerate(statements):
+        cls = type(statement)
+        terminates = False
+        if cls is IfStmt:
+            value = _constant(statement.condition)
+            if value is not None:
+                context.count(PASS_NAME, "static_branches")
+                taken, terminates = _prune_block(statement.then_body if value else statement.else_body, context)
+                result.extend(taken)
+            else:
+                statement.then_body, then_exits = _prune_block(statement.then_body, context)
+                statement.else_body, else_exits = _prune_block(statement.else_body, context)
+                terminates = then_exits and else_exits
+                result.append(statement)
+        elif cls is WhileStmt:
+            value = _constant(statement.condition)
+            if value == 0:
+                context.count(PASS_NAME, "dead_loops")
+                continue
+            statement.body, _ = _prune_block(statement.body, context)
+            terminates = value is not None  # `while (1)` is only left through exit
+            result.append(statement)
+        else:
+            terminates = cls is ExitStmt
+            result.append(statement)
+        if terminates:
+            unreachable = len(statements) - index - 1
+            if unreachable:
+                context.count(PASS_NAME, "unreachable", unreachable)
+            return result, True
+    return result, False
+
+
+def _sweep_block(statements: List[ASTNode], live: Set[str], dead_lets: set, context) -> Set[str]:
+    """Drop dead stores from the block in place; returns the variables live on entry.
+
+    `live` holds the variables that may be read after the block. A `let` whose
+    value is dead is kept for now, since it also declares the variable; a literal
+    value stays, as it may be the variable's initial value, and anything else
+    becomes 0. _remove_unused_lets decides whether the `let` can go.
+    """
+    kept = []
+    for statement in reversed(statements):
+        cls = type(statement)
+        if cls is LetStmt or cls is AssignStmt:
+            if statement.name not in live and not may_trap(statement.expr):
+                if cls is AssignStmt:
+                    context.count(PASS_NAME, "dead_stores")
+                    continue
+                if type(statement.expr) is not IntLit:
+                    context.count(PASS_NAME, "dead_stores")
+                    statement.expr = IntLit(0)
+                dead_lets.add(id(statement))
+            else:
+                live = (live - {statement.name}) | _uses(statement.expr)
+        elif cls is IfStmt:
+            then_live = _sweep_block(statement.then_body, live, dead_lets, context)
+            else_live = _sweep_block(statement.else_body, live, dead_lets, context)
+            if not statement.then_body and not statement.else_body and not may_trap(statement.condition):
+                context.count(PASS_NAME, "empty_branches")
+                continue
+            live = then_live | else_live | _uses(statement.condition)
+        elif cls is WhileStmt:
+            # Anything the loop reads may be read on a later iteration: a cheap over-approximation
+            # of the loop's fixpoint that needs one walk per loop instead of iterating nested loops.
+            live = live | _uses(statement)
+            _sweep_block(statement.body, live, dead_lets, context)
+        elif cls is ExitStmt:
+            live = _uses(statement.arg)  # nothing after an exit is read
+        elif cls is PrintStmt:
+            if type(statement.arg) is not StringLit:
+                live = live | _uses(statement.arg)
+        elif cls is FunctionCall:
+            live = live | _uses(statement)
+        kept.append(statement)
+    kept.reverse()
+    statements[:] = kept
+    return live
+
+
+def _remove_unused_lets(program: Program, dead_lets: set, context):
+    """Remove dead `let`s of variables that nothing else reads, assigns or declares."""
+    referenced = set()
+    for node, _ in walk(program):
+        cls = type(node)
+        if cls is Var or cls is AssignStmt or (cls is LetStmt and id(node) not in dead_lets):
+            referenced.add(node.name)
+    removed = set()
+    stack = [program.body]
+    while stack:
+        statements = stack.pop()
+        kept = []
+        for statement in statements:
+            if id(statement) in dead_lets and statement.name not in referenced:
+                removed.add(statement.name)
+                continue
+            kept.append(statement)
+            if type(statement) is IfStmt:
+                stack.append(statement.then_body)
+                stack.append(statement.else_body)
+            elif type(statement) is WhileStmt:
+                stack.append(statement.body)
+        statements[:] = kept
+    if removed:
+        context.count(PASS_NAME, "unused_variables", len(removed))
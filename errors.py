@@ -0,0 +1,40 @@
+class CompileError(Exception):
+    """An error in the program being compiled.
+
+    The compiler raises these instead of exiting so that a driver compiling many
+    files can report the failure for one input and carry on with the rest.
+    """
+
+
+class LexError(CompileError):
+    pass
+
+
+class ParseError(CompileError):
+    pass
+
+
+class CodegenError(CompileError):
+    pass
+
+
+class Diagnostic:
+    """A non-fatal message about the program, e.g. a construct the compiler skipped."""
+
+    __slots__ = ("severity", "message")
+
+    WARNING = "warning"
+
+    def __init__(self, severity: str, message: str):
+        self.severity = severity
+        self.message = message
+
+    def __str__(self):
+        return f"{self.severity}: {self.message}"
+
+    def __repr__(self):
+        return f"Diagnostic({self.severity!r}, {self.message!r})"
+
+
+class VerificationError(Exception):
+    """An optimization pass left the tree malformed: a compiler bug, not an error in the program."""
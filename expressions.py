@@ -1,114 +1,123 @@
-from ast_lib import ASTNode, NodeType
-from lexer import Token, INT, IDENTIFIER, OPERATOR
+from ast_lib import ASTNode, BinaryOp, IntLit, UnaryOp, Var
+from errors import ParseError
+from lexer import TokenStream, INT, IDENTIFIER, OPERATOR
 
-class ExpressionParser:
-    def __init__(self, tokens, pos=0):
-        self.tokens = tokens
-        self.pos = pos
+LEFT = "left"
+RIGHT = "right"
 
-    def current_token(self):
-        if self.pos < len(self.tokens):
-            return self.tokens[self.pos]
-        return None
+# Binary operator tiers from loosest to tightest binding.
+BINARY_TIERS = [
+    (('||',), LEFT),
+    (('&&',), LEFT),
+    (('==', '!='), LEFT),
+    (('<', '<=', '>', '>='), LEFT),
+    (('+', '-'), LEFT),
+    (('*', '/'), LEFT),
+]
 
-    def advance(self):
-        self.pos += 1
-        return self.current_token()
 
-    def parse_expression(self):
-        node = self.parse_term()
+def _binding_powers():
+    """operator -> (left binding power, right binding power).
 
-        while self.pos < len(self.tokens):
-            token = self.current_token()
-            if token.type == OPERATOR and token.value in ('+', '-'):
-                op = token.value
-                self.advance()
-                right = self.parse_term()
-                node = ASTNode(NodeType.BINARY_OP, op, left=node, right=right)
-            elif token.type == OPERATOR and token.value == '==':
-                op = token.value
-                self.advance()
-                right = self.parse_term()
-                node = ASTNode(NodeType.BINARY_OP, op, left=node, right=right)
-            elif token.type == OPERATOR and token.value == '!=':
-                op = token.value
-                self.advance()
-                right = self.parse_term()
-                node = ASTNode(NodeType.BINARY_OP, op, left=node, right=right)
-            elif token.type == OPERATOR and token.value == '>':
-                op = token.value
-                self.advance()
-                right = self.parse_term()
-                node = ASTNode(NodeType.BINARY_OP, op, left=node, right=right)
-            elif token.type == OPERATOR and token.value == '<':
-                op = token.value
-                self.advance()
-                right = self.parse_term()
-                node = ASTNode(NodeType.BINARY_OP, op, left=node, right=right)
-            elif token.type == OPERATOR and token.value == '>=':
-                op = token.value
-                self.advance()
-                right = self.parse_term()
-                node = ASTNode(NodeType.BINARY_OP, op, left=node, right=right)
-            elif token.type == OPERATOR and token.value == '<=':
-                op = token.value
-                self.advance()
-                right = self.parse_term()
-                node = ASTNode(NodeType.BINARY_OP, op, left=node, right=right)
-            elif token.type == OPERATOR and token.value == '&&':
-                op = token.value
-                self.advance()
-                right = self.parse_term()
-                node = ASTNode(NodeType.BINARY_OP, op, left=node, right=right)
-            elif token.type == OPERATOR and token.value == '||':
-                op = token.value
-                self.advance()
-                right = self.parse_term()
-                node = ASTNode(NodeType.BINARY_OP, op, left=node, right=right)
-            elif token.type == OPERATOR and token.value == '!':
-                op = token.value
-                self.advance()
-                right = self.parse_term()
-                node = ASTNode(NodeType.BINARY_OP, op, left=node, right=right)
-            else:
-                break
+    A left-associative operator binds its right operand one notch tighter than itself,
+    a right-associative one a notch looser.
+    """
+    powers = {}
+    for tier, (operators, associativity) in enumerate(BINARY_TIERS, start=1):
+        power = tier * 2
+        for op in operators:
+            powers[op] = (power, power + 1) if associativity == LEFT else (power, power - 1)
+    return powers
 
-        return node, self.pos
 
-    def parse_term(self):
-        node = self.parse_factor()
+BINARY_BINDING_POWER = _binding_powers()
 
-        while self.pos < len(self.tokens):
-            token = self.current_token()
-            if token.type == OPERATOR and token.value in ('*', '/'):
-                op = token.value
+# Prefix operators bind tighter than every binary operator: -a * b is (-a) * b.
+PREFIX_BINDING_POWER = {
+    '-': (len(BINARY_TIERS) + 1) * 2,
+    '!': (len(BINARY_TIERS) + 1) * 2,
+}
+
+# Marks an open parenthesis among the pending operators of ExpressionParser.parse_expression.
+PAREN = '('
+
+
+class ExpressionParser:
+    """Pratt (precedence-climbing) parser working in place on a shared TokenStream.
+
+    Operators still waiting for their right operand and open parentheses are kept
+    on an explicit stack rather than in recursive calls, so deeply nested
+    expressions cost no Python stack.
+    """
+
+    def __init__(self, stream: TokenStream):
+        self.stream = stream
+
+    def current_token(self):
+        return self.stream.current
+
+    def advance(self):
+        return self.stream.advance()
+
+    def parse_expression(self, min_power: int = 0) -> ASTNode:
+        stream = self.stream
+        binding_power = BINARY_BINDING_POWER
+        # (operator or PAREN, left operand or None for a prefix operator, min_power around it)
+        pending = []
+
+        while True:
+            # Prefix operators and open parentheses, then the operand they apply to
+            while True:
+                token = stream.current
+                if token is None:
+                    raise ParseError("Unexpected end of input during expression parsing")
+                if token.type == OPERATOR and token.value in PREFIX_BINDING_POWER:
+                    pending.append((token.value, None, min_power))
+                    min_power = PREFIX_BINDING_POWER[token.value]
+                elif token.value == '(':
+                    pending.append((PAREN, None, min_power))
+                    min_power = 0
+                else:
+                    break
                 self.advance()
-                right = self.parse_factor()
-                node = ASTNode(NodeType.BINARY_OP, op, left=node, right=right)
-            else:
-                break
+            node = self.parse_factor()
 
-        return node
+            # Binary operators binding at least min_power take node as their left operand;
+            # anything else completes the innermost pending operator or parenthesis
+            while True:
+                token = stream.current
+                if token is not None and token.type == OPERATOR:
+                    powers = binding_power.get(token.value)
+                    if powers is not None and powers[0] >= min_power:
+                        pending.append((token.value, node, min_power))
+                        min_power = powers[1]
+                        self.advance()
+                        break
+                if not pending:
+                    return node
+                op, left, min_power = pending.pop()
+                if op == PAREN:
+                    if token is None or token.value != ')':
+                        raise ParseError("Expected ')'")
+                    self.advance()  # consume ')'
+                elif left is None:
+                    node = UnaryOp(op, node)
+                else:
+                    node = BinaryOp(op, left, node)
 
-    def parse_factor(self):
+    def parse_factor(self) -> ASTNode:
+        """An integer literal or a variable."""
         token = self.current_token()
         if token is None:
-            raise SyntaxError("Unexpected end of input during expression parsing")
+            raise ParseError("Unexpected end of input during expression parsing")
 
         if token.type == INT:
-            node = ASTNode(NodeType.INT_LIT, int(token.value))
+            node = IntLit(int(token.value))
             self.advance()
             return node
         elif token.type == IDENTIFIER:
-            node = ASTNode(NodeType.VAR, token.value)
+            node = Var(token.value)
             self.advance()
             return node
-        elif token.value == '(':
-            self.advance()  # consume '('
-            node, _ = self.parse_expression()
-            if self.current_token() is None or self.current_token().value != ')':
-                raise SyntaxError("Expected ')'")
-            self.advance()  # consume ')'
-            return node
         else:
-            raise SyntaxError(f"Unexpected token in expression: {token.value}")
+            raise ParseError(f"Unexpected token in expression: {token.value}")
@@ -1,5 +1,11 @@
-import sys
-from typing import List, Optional, Tuple
+import mmap
+import re
+from array import array
+from collections import deque
+from typing import Iterable, Iterator, Optional, Tuple, Union
+
+from errors import LexError
+from tracing import trace
 
 BEGINNING = 0
 INT = 1
@@ -13,139 +19,283 @@ UNKNOWN = 8
 BOOL_LIT = 9
 ASSIGN = 10
 
+TOKEN_TYPE_NAMES = {
+    BEGINNING: "BEGINNING",
+    INT: "INT",
+    KEYWORD: "KEYWORD",
+    SEPARATOR: "SEPARATOR",
+    END_OF_TOKENS: "END_OF_TOKENS",
+    OPERATOR: "OPERATOR",
+    STRING: "STRING",
+    IDENTIFIER: "IDENTIFIER",
+    BOOL_LIT: "BOOL_LIT",
+    ASSIGN: "ASSIGN",
+    UNKNOWN: "UNKNOWN"
+}
+
+# Reserved words -> (token type, token value). Anything else made of letters is an identifier.
+KEYWORDS = {
+    b"exit": (KEYWORD, "EXIT"),
+    b"print": (KEYWORD, "PRINT"),
+    b"let": (KEYWORD, "LET"),
+    b"if": (KEYWORD, "IF"),
+    b"else": (KEYWORD, "ELSE"),
+    b"while": (KEYWORD, "WHILE"),
+    b"true": (BOOL_LIT, "TRUE"),
+    b"false": (BOOL_LIT, "FALSE"),
+    b"assign": (KEYWORD, "ASSIGN"),
+    b"processor": (KEYWORD, "PROCESSOR"),
+    b"call": (KEYWORD, "CALL"),
+}
+
+SEPARATORS = "(){};,"
+
+# Longest spellings first so the scanner always takes the maximal munch ("<=" before "<").
+OPERATORS = sorted(["+", "-", "*", "/", "=", "<", ">", "!", "==", "!=", "<=", ">=", "&&", "||"],
+                   key=len, reverse=True)
+
+# Character classes, one alternative per token class. Order matters: comments must be
+# tried before the '/' operator and a lone '"' only matches when the string is unterminated.
+# The scanner works on bytes so it can run directly over a memory-mapped file.
+_TOKEN_CLASSES = [
+    ("SKIP", r"\s+"),
+    ("COMMENT", r"//[^\n]*"),
+    ("INT", r"[0-9]+"),
+    ("WORD", r"[A-Za-z]+"),
+    ("STRING", r'"[^"]*"'),
+    ("UNTERMINATED", r'"'),
+    ("SEPARATOR", "[" + re.escape(SEPARATORS) + "]"),
+    ("OPERATOR", "|".join(re.escape(op) for op in OPERATORS)),
+    ("MISMATCH", r"."),
+]
+
+_TOKEN_RE = re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern in _TOKEN_CLASSES).encode(),
+                       re.DOTALL)
+
+# Token classes whose type does not depend on the matched text.
+_CLASS_TYPES = {
+    "INT": INT,
+    "SEPARATOR": SEPARATOR,
+    "OPERATOR": OPERATOR,
+}
+
+
 class Token:
+    __slots__ = ("type", "value")
+
     def __init__(self, type_: int, value: Optional[str] = None):
         self.type = type_
         self.value = value
 
     def __repr__(self):
-        type_names = {
-            BEGINNING: "BEGINNING",
-            INT: "INT",
-            KEYWORD: "KEYWORD",
-            SEPARATOR: "SEPARATOR",
-            END_OF_TOKENS: "END_OF_TOKENS",
-            OPERATOR: "OPERATOR",
-            IDENTIFIER: "IDENTIFIER",
-            BOOL_LIT: "BOOL_LIT",
-            ASSIGN: "ASSIGN",
-            UNKNOWN: "UNKNOWN"
-        }
-        return f"Token(type={type_names.get(self.type, 'UNKNOWN')}, value='{self.value}')"
+        return f"Token(type={TOKEN_TYPE_NAMES.get(self.type, 'UNKNOWN')}, value='{self.value}')"
 
 def print_token(token: Token):
-    type_names = {
-        BEGINNING: "BEGINNING",
-        INT: "INT",
-        KEYWORD: "KEYWORD",
-        SEPARATOR: "SEPARATOR",
-        END_OF_TOKENS: "END_OF_TOKENS",
-        OPERATOR: "OPERATOR",
-        IDENTIFIER: "IDENTIFIER",
-        BOOL_LIT: "BOOL_LIT",
-        ASSIGN: "ASSIGN",
-        UNKNOWN: "UNKNOWN"
-    }
-    print(f"TOKEN VALUE: '{token.value if token.value else ''}' TOKEN TYPE: {type_names.get(token.type, 'UNKNOWN')}")
-
-def generate_number(current: str, current_index: int) -> Tuple[Token, int]:
-    buffer = []
-    while current_index < len(current) and current[current_index].isdigit():
-        buffer.append(current[current_index])
-        current_index += 1
-    
-    return Token(INT, ''.join(buffer)), current_index
-
-def generate_keyword(current: str, current_index: int) -> Tuple[Token, int]:
-    buffer = []
-    while current_index < len(current) and current[current_index].isalpha():
-        buffer.append(current[current_index])
-        current_index += 1
-    
-    keyword = ''.join(buffer)
-    if keyword == "exit":
-        return Token(KEYWORD, "EXIT"), current_index
-    elif keyword == 'print':
-        return Token(KEYWORD, "PRINT"), current_index
-    elif keyword == 'let':
-        return Token(KEYWORD, "LET"), current_index
-    elif keyword == 'if':
-        return Token(KEYWORD, "IF"), current_index
-    elif keyword == 'else':
-        return Token(KEYWORD, "ELSE"), current_index
-    elif keyword == 'while':
-        return Token(KEYWORD, "WHILE"), current_index
-    elif keyword == 'true':
-        return Token(BOOL_LIT, "TRUE"), current_index
-    elif keyword == 'false':
-        return Token(BOOL_LIT, "FALSE"), current_index
-    elif keyword == 'assign':
-        return Token(KEYWORD, "ASSIGN"), current_index
-    elif keyword == 'processor':
-        return Token(KEYWORD, "PROCESSOR"), current_index
-    elif keyword == 'call':
-        return Token(KEYWORD, "CALL"), current_index
-    else:
-        return Token(IDENTIFIER, keyword), current_index
-
-def generate_separator(current: str, current_index: int) -> Tuple[Token, int]:
-    token = Token(SEPARATOR, current[current_index])
-    return token, current_index + 1
-
-def generate_operator(current: str, current_index: int) -> Tuple[Token, int]:
-    token = Token(OPERATOR, current[current_index])
-    return token, current_index + 1
-
-def generate_string(current: str, current_index: int) -> Tuple[Token, int]:
-    current_index += 1  # Skip the opening quote
-    buffer = []
-    while current_index < len(current) and current[current_index] != '"':
-        buffer.append(current[current_index])
-        current_index += 1
-
-    if current_index >= len(current) or current[current_index] != '"':
-        sys.stderr.write("Unterminated string literal\n")
-        sys.exit(1)
-
-    current_index += 1  # Skip the closing quote
-    return Token(STRING, ''.join(buffer)), current_index
-
-
-def lexer(file_path: str) -> List[Token]:
-    with open(file_path, 'r') as file:
-        current = file.read()
-    
-    tokens = []
-    current_index = 0
-    
-    while current_index < len(current):
-        if current[current_index].isspace():
-            current_index += 1
-            continue
-            
-        token = None
-        
-        if current[current_index].isdigit():
-            token, current_index = generate_number(current, current_index)
-        elif current[current_index].isalpha():
-            token, current_index = generate_keyword(current, current_index)
-        elif current[current_index] == '"':
-            token, current_index = generate_string(current, current_index)
-        elif current[current_index] in ["(", ")", "{", "}", ";", ","]:
-            token, current_index = generate_separator(current, current_index)
-        elif current[current_index] == "/" and current_index + 1 < len(current) and current[current_index + 1] == "/":
-            # Handle single-line comments
-            while current_index < len(current) and current[current_index] != "\n":
-                current_index += 1
+    print(f"TOKEN VALUE: '{token.value if token.value else ''}' TOKEN TYPE: {TOKEN_TYPE_NAMES.get(token.type, 'UNKNOWN')}")
+
+def _scan(buffer) -> Iterator[Tuple[int, int, int]]:
+    """Single pass of the token regex over a bytes-like buffer, yielding (type, start, end).
+
+    Offsets delimit the token's value in the buffer, so string tokens exclude their quotes.
+    """
+    keywords = KEYWORDS
+    class_types = _CLASS_TYPES
+
+    for match in _TOKEN_RE.finditer(buffer):
+        kind = match.lastgroup
+        if kind == "SKIP" or kind == "COMMENT":
             continue
-        elif current[current_index] in "+-*/=<>":
-            token, current_index = generate_operator(current, current_index)
+        start, end = match.span()
+        if kind == "WORD":
+            keyword = keywords.get(match.group())
+            yield (keyword[0] if keyword is not None else IDENTIFIER), start, end
+        elif kind == "STRING":
+            yield STRING, start + 1, end - 1
+        elif kind in class_types:
+            yield class_types[kind], start, end
+        elif kind == "UNTERMINATED":
+            raise LexError(f"Unterminated string literal on line {_line_number(buffer, start)}")
         else:
-            sys.stderr.write(f"Unknown character: {current[current_index]}\n")
-            sys.exit(1)
-            
-        tokens.append(token)
-    
-    tokens.append(Token(END_OF_TOKENS))
-    print(tokens)
-    return tokens
\ No newline at end of file
+            raise LexError(f"Unknown character: {match.group().decode(errors='replace')} "
+                           f"on line {_line_number(buffer, start)}")
+
+
+def _line_number(buffer, offset: int) -> int:
+    return bytes(buffer[:offset]).count(b"\n") + 1
+
+
+def _token_value(type_: int, text: bytes) -> str:
+    # str(text, ...) and bytes(text) accept any bytes-like slice, so memoryview sources
+    # work too; for bytes sources bytes(text) returns text itself.
+    if type_ == KEYWORD or type_ == BOOL_LIT:
+        return KEYWORDS[bytes(text)][1]
+    return str(text, "utf-8")
+
+
+def iter_tokens(buffer) -> Iterator[Token]:
+    """Lazily scan a bytes-like buffer (bytes, mmap, memoryview) into tokens."""
+    for type_, start, end in _scan(buffer):
+        yield Token(type_, _token_value(type_, buffer[start:end]))
+    yield Token(END_OF_TOKENS)
+
+
+def tokenize(current: Union[str, bytes, memoryview]) -> 'TokenStore':
+    if isinstance(current, str):
+        current = current.encode()
+    return TokenStore.from_buffer(current)
+
+
+def buffer_tokens(buffer) -> Iterator[Token]:
+    """iter_tokens with lex tracing applied, for parsing straight out of an in-memory buffer."""
+    tokens = iter_tokens(buffer)
+    return _traced(tokens) if trace.lex else tokens
+
+
+def stream_tokens(file_path: str) -> Iterator[Token]:
+    """Yield tokens straight out of a memory-mapped source file without reading it into memory."""
+    tokens = _map_tokens(file_path)
+    return _traced(tokens) if trace.lex else tokens
+
+
+def _traced(tokens: Iterable[Token]) -> Iterator[Token]:
+    for token in tokens:
+        trace.log("lex", repr(token))
+        yield token
+
+
+def _map_tokens(file_path: str) -> Iterator[Token]:
+    with open(file_path, 'rb') as file:
+        try:
+            source = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty files cannot be mapped
+            yield Token(END_OF_TOKENS)
+            return
+        with source:
+            yield from iter_tokens(source)
+
+
+class TokenStream:
+    """Forward-only cursor over a token iterable with a small lookahead buffer.
+
+    Works the same over a materialized list or a lazy generator such as stream_tokens(),
+    so only the tokens currently being looked at are ever held in memory.
+    """
+
+    __slots__ = ("_tokens", "_buffer", "position", "current")
+
+    def __init__(self, tokens: Iterable[Token]):
+        self._tokens = iter(tokens)
+        self._buffer = deque()
+        self.position = 0
+        self.current = self.peek(0)
+
+    def peek(self, offset: int = 0) -> Optional[Token]:
+        """Token `offset` places ahead of the cursor, or None past the end of input."""
+        buffer = self._buffer
+        while len(buffer) <= offset:
+            token = next(self._tokens, None)
+            if token is None:
+                return None
+            buffer.append(token)
+        return buffer[offset]
+
+    def advance(self) -> Optional[Token]:
+        if self.current is not None:
+            self._buffer.popleft()
+            self.position += 1
+            self.current = self.peek(0)
+        return self.current
+
+
+class TokenView:
+    """Token materialized on demand from a TokenStore row; same interface as Token."""
+
+    __slots__ = ("type", "_store", "_index")
+
+    def __init__(self, store: 'TokenStore', index: int):
+        self.type = store.types[index]
+        self._store = store
+        self._index = index
+
+    @property
+    def value(self) -> Optional[str]:
+        return self._store.value(self._index)
+
+    def __repr__(self):
+        return f"Token(type={TOKEN_TYPE_NAMES.get(self.type, 'UNKNOWN')}, value='{self.value}')"
+
+    def __repr__(self):
+        return f"Token(type={TOKEN_TYPE_NAMES.get(self.type, 'UNKNOWN')}, value='{self.value}')"
+
+
+class TokenStore:
+    """Columnar token list: one byte of type and two offsets into the source per token.
+
+    Values are sliced out of the source buffer only when a TokenView asks for them, and
+    identifiers are interned so every occurrence of a name shares one string. This is
+    what tokenize() returns when the whole token list is wanted at once; compiling does
+    not need one, since the parser reads tokens as buffer_tokens() scans them.
+    """
+
+    __slots__ = ("source", "types", "starts", "ends", "ids", "names", "_name_ids")
+
+    def __init__(self, source):
+        self.source = source
+        self.types = array('B')
+        self.starts = array('I')
+        self.ends = array('I')
+        self.ids = array('I')  # interned name id for identifiers, 0 for everything else
+        self.names = []
+        self._name_ids = {}
+
+    @classmethod
+    def from_buffer(cls, buffer) -> 'TokenStore':
+        store = cls(buffer)
+        types_append = store.types.append
+        starts_append = store.starts.append
+        ends_append = store.ends.append
+        ids_append = store.ids.append
+        for type_, start, end in _scan(buffer):
+            types_append(type_)
+            starts_append(start)
+            ends_append(end)
+            ids_append(store.intern(buffer[start:end]) if type_ == IDENTIFIER else 0)
+        types_append(END_OF_TOKENS)
+        starts_append(len(buffer))
+        ends_append(len(buffer))
+        ids_append(0)
+        return store
+
+    def intern(self, name: bytes) -> int:
+        name = bytes(name)
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = self._name_ids[name] = len(self.names)
+            self.names.append(name.decode())
+        return name_id
+
+    def value(self, index: int) -> Optional[str]:
+        type_ = self.types[index]
+        if type_ == IDENTIFIER:
+            return self.names[self.ids[index]]
+        if type_ == END_OF_TOKENS:
+            return None
+        return _token_value(type_, self.source[self.starts[index]:self.ends[index]])
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def __iter__(self) -> Iterator[TokenView]:
+        for index in range(len(self.types)):
+            yield TokenView(self, index)
+
+
+def lexer(file_path: str) -> TokenStore:
+    with open(file_path, 'rb') as file:
+        current = file.read()
+
+    tokens = tokenize(current)
+    if trace.lex:
+        for token in tokens:
+            trace.log("lex", repr(token))
+    return tokens
@@ -0,0 +1,165 @@
+from typing import Iterable, List
+
+from ast_lib import (ASTNode, AssignStmt, BinaryOp, ExitStmt, FunctionCall, IfStmt, IntLit, LetStmt, PrintStmt,
+                     Program, StringLit, UnaryOp, Var, WhileStmt, walk)
+from constant_folding import wrap32
+
+PASS_NAME = "loop-invariant-code-motion"
+# Hoisted values go in variables named TEMPORARY_PREFIX plus a letter suffix (identifiers are letters only).
+TEMPORARY_PREFIX = "invariant"
+OPERATOR_TYPES = (BinaryOp, UnaryOp)
+
+
+class TemporaryNames:
+    """Hands out variable names no other variable of the program uses."""
+
+    __slots__ = ("taken", "counter")
+
+    def __init__(self, taken: Iterable[str]):
+        self.taken = set(taken)
+        self.counter = 0
+
+    def fresh(self) -> str:
+        while True:
+            suffix = ""
+            number = self.counter
+            self.counter += 1
+            while True:
+                number, digit = divmod(number, 26)
+                suffix = chr(ord("a") + digit) + suffix
+                if not number:
+                    break
+            name = TEMPORARY_PREFIX + suffix
+            if name not in self.taken:
+                self.taken.add(name)
+                return name
+
+
+def hoist_loop_invariants(program: Program, context) -> Program:
+    """Compute expressions a `while` loop re-evaluates to the same value once, before the loop.
+
+    An operator whose variables the loop never assigns is moved into a `let` of a
+    new variable just before the loop, and the loop reads the variable instead;
+    equal expressions in one loop share it. Loops are visited outermost first, so
+    an expression leaves every loop it is invariant in. The hoisted code runs even
+    when the loop, or the branch holding the expression, would not, so divisions
+    that may fault stay where they are. A loop that calls a function is left
+    alone, since the call may assign any variable.
+    """
+    names = TemporaryNames(node.name for node, _ in walk(program)
+                           if type(node) in (Var, LetStmt, AssignStmt))
+    _hoist_block(program.body, names, context)
+    return program
+
+
+def _hoist_block(statements: List[ASTNode], names: TemporaryNames, context):
+    result = []
+    for statement in statements:
+        cls = type(statement)
+        if cls is WhileStmt:
+            result.extend(LoopHoister(statement, names, context).hoist())
+            result.append(statement)
+            _hoist_block(statement.body, names, context)
+        else:
+            result.append(statement)
+            if cls is IfStmt:
+                _hoist_block(statement.then_body, names, context)
+                _hoist_block(statement.else_body, names, context)
+    statements[:] = result
+
+
+class LoopHoister:
+    """Replaces the invariant operators of one loop with variables; hoist() returns their `let`s."""
+
+    __slots__ = ("loop", "names", "context", "assigned", "temporaries", "hoisted")
+
+    def __init__(self, loop: WhileStmt, names: TemporaryNames, context):
+        self.loop = loop
+        self.names = names
+        self.context = context
+        self.assigned = set()
+        self.temporaries = {}  # expression key -> variable holding its value
+        self.hoisted = []
+
+    def hoist(self) -> List[LetStmt]:
+        loop = self.loop
+        for node, _ in walk(loop):
+            cls = type(node)
+            if cls is LetStmt or cls is AssignStmt:
+                self.assigned.add(node.name)
+            elif cls is FunctionCall:
+                return []
+        loop.condition = self._replace(loop.condition)
+        stack = [loop.body]
+        while stack:
+            for statement in stack.pop():
+                cls = type(statement)
+                if cls is LetStmt or cls is AssignStmt:
+                    statement.expr = self._replace(statement.expr)
+                elif cls is IfStmt or cls is WhileStmt:
+                    statement.condition = self._replace(statement.condition)
+                    if cls is IfStmt:
+                        stack.append(statement.then_body)
+                        stack.append(statement.else_body)
+                    else:
+                        stack.append(statement.body)
+                elif cls is PrintStmt:
+                    if type(statement.arg) is not StringLit:
+                        statement.arg = self._replace(statement.arg)
+                elif cls is ExitStmt:
+                    if statement.arg is not None:
+                        statement.arg = self._replace(statement.arg)
+        return self.hoisted
+
+    def _replace(self, expr: ASTNode) -> ASTNode:
+        """The expression with its largest invariant operators replaced by variables."""
+        movable = self._movable(expr)
+        if id(expr) in movable:
+            return self._temporary(expr)
+        stack = [expr]
+        while stack:
+            node = stack.pop()
+            for field in node.children:
+                child = getattr(node, field)
+                if id(child) in movable:
+                    setattr(node, field, self._temporary(child))
+                elif type(child) in OPERATOR_TYPES:
+                    stack.append(child)
+        return expr
+
+    def _movable(self, expr: ASTNode) -> set:
+        """Ids of the operators in expr that read a variable, no variable the loop assigns, and cannot fault."""
+        assigned = self.assigned
+        invariant = {}  # id -> None without variables, else whether no variable is assigned in the loop
+        movable = set()
+        for node, _ in reversed(list(walk(expr))):  # children before their parent
+            cls = type(node)
+            if cls is Var:
+                invariant[id(node)] = node.name not in assigned
+                continue
+            if cls is BinaryOp:
+                left, right = invariant[id(node.left)], invariant[id(node.right)]
+                value = None if left is None and right is None else left is not False and right is not False
+                if value is not False and node.op == "/":
+                    divisor = node.right
+                    if type(divisor) is not IntLit or wrap32(divisor.value) in (0, -1):
+                        value = False
+            elif cls is UnaryOp:
+                value = invariant[id(node.operand)]
+            else:
+                value = None
+            invariant[id(node)] = value
+            if value:
+                movable.add(id(node))
+        return movable
+
+    def _temporary(self, expr: ASTNode) -> Var:
+        key = tuple((type(node), getattr(node, node.label) if node.label else None) for node, _ in walk(expr))
+        name = self.temporaries.get(key)
+        if name is None:
+            name = self.temporaries[key] = self.names.fresh()
+            self.hoisted.append(LetStmt(name, expr))
+            self.context.count(PASS_NAME, "hoisted")
+        else:
+            self.context.count(PASS_NAME, "reused")
+        return Var(name)
@@ -0,0 +1,197 @@
+from typing import Dict, List, Optional
+
+from ast_lib import (ASTNode, AssignStmt, BinaryOp, FunctionCall, IfStmt, IntLit, LetStmt, Program, Var, WhileStmt,
+                     copy_tree, walk)
+from constant_folding import evaluate_binary, wrap32
+
+PASS_NAME = "loop-unrolling"
+# A loop known to run at most this many times is replaced by that many copies of its body.
+MAX_FULL_UNROLL = 16
+# No loop is unrolled into more than this many AST nodes.
+SIZE_BUDGET = 256
+# The operator for the same test with the operands swapped.
+SWAPPED = {'<': '>', '<=': '>=', '>': '<', '>=': '<=', '==': '==', '!=': '!='}
+# Operators a partially unrolled loop can count towards, with the sign its step must have.
+STEP_SIGN = {'<': 1, '<=': 1, '>': -1, '>=': -1}
+
+
+class InductionVariable:
+    """`while (variable op bound)` where the body adds the constant step to variable once per iteration."""
+
+    __slots__ = ("variable", "op", "bound", "step")
+
+    def __init__(self, variable: str, op: str, bound: ASTNode, step: int):
+        self.variable = variable
+        self.op = op
+        self.bound = bound
+        self.step = step
+
+
+def unroll_loops(program: Program, context) -> Program:
+    """Unroll `while` loops driven by an induction variable, within SIZE_BUDGET.
+
+    A loop qualifies when its condition compares a variable with a literal (or a
+    variable of known value the loop does not assign) and its body steps that
+    variable by a constant exactly once, in an assignment at the top level of the
+    body, and assigns it nowhere else. When the variable's value on entry is known
+    from the straight-line code before the loop, the trip count is simulated with
+    32-bit wraparound; a loop running at most MAX_FULL_UNROLL times becomes that
+    many copies of its body. Otherwise a counting loop (<, <=, > or >= with a step
+    towards the bound) is unrolled by options.unroll_factor: the unrolled loop runs
+    while a whole group of iterations stays within the bound, and the original
+    loop follows it to run the remaining ones, unless the known trip count is a
+    multiple of the factor. Loops that call a function are
+    left alone. Inner loops are unrolled first and count towards their outer
+    loop's size.
+    """
+    _unroll_block(program.body, {}, context)
+    return program
+
+
+def _unroll_block(statements: List[ASTNode], env: Dict[str, int], context):
+    """Unroll the loops of a block in place; env maps variables to their values on entry."""
+    result = []
+    for statement in statements:
+        cls = type(statement)
+        if cls is LetStmt or cls is AssignStmt:
+            if type(statement.expr) is IntLit:
+                env[statement.name] = wrap32(statement.expr.value)
+            else:
+                env.pop(statement.name, None)
+            result.append(statement)
+        elif cls is IfStmt:
+            _unroll_block(statement.then_body, dict(env), context)
+            _unroll_block(statement.else_body, dict(env), context)
+            _forget_assigned(statement, env)
+            result.append(statement)
+        elif cls is WhileStmt:
+            assigned, calls = _assignments(statement)
+            if calls:
+                env.clear()
+                result.append(statement)
+                continue
+            # The body starts with what is known before the loop and never changed by it
+            _unroll_block(statement.body, {name: value for name, value in env.items() if name not in assigned},
+                          context)
+            result.extend(_unroll(statement, env, assigned, context))
+            for name in assigned:
+                env.pop(name, None)
+        elif cls is FunctionCall:
+            env.clear()
+            result.append(statement)
+        else:
+            result.append(statement)
+    statements[:] = result
+
+
+def _assignments(statement: ASTNode) -> tuple:
+    """The variables the statement may assign, and whether it calls a function."""
+    assigned = set()
+    calls = False
+    for node, _ in walk(statement):
+        if type(node) is LetStmt or type(node) is AssignStmt:
+            assigned.add(node.name)
+        elif type(node) is FunctionCall:
+            calls = True
+    return assigned, calls
+
+
+def _forget_assigned(statement: ASTNode, env: Dict[str, int]):
+    assigned, calls = _assignments(statement)
+    if calls:
+        env.clear()
+    for name in assigned:
+        env.pop(name, None)
+
+
+def _unroll(loop: WhileStmt, env: Dict[str, int], assigned: set, context) -> List[ASTNode]:
+    """The statements replacing the loop; env holds what is known on entry."""
+    induction = _induction_variable(loop)
+    if induction is None:
+        return [loop]
+    bound = induction.bound
+    if type(bound) is IntLit:
+        bound = wrap32(bound.value)
+    elif bound.name in assigned or bound.name not in env:
+        return [loop]
+    else:
+        bound = env[bound.name]
+
+    size = sum(1 for _ in walk(loop))
+    start = env.get(induction.variable)
+    trips = None
+    if start is not None:
+        trips = _trip_count(induction.op, start, bound, induction.step)
+        if trips is not None and trips * size <= SIZE_BUDGET:
+            context.count(PASS_NAME, "fully_unrolled")
+            return _copies(loop.body, trips)
+
+    factor = context.options.unroll_factor
+    if (factor < 2 or STEP_SIGN.get(induction.op) != (1 if induction.step > 0 else -1)
+            or (trips is not None and trips < factor) or size * (factor + 1) > SIZE_BUDGET):
+        return [loop]
+    # variable op bound - (factor - 1) * step holds only if the next `factor` tests all would
+    last_bound = bound - (factor - 1) * induction.step
+    if last_bound != wrap32(last_bound):
+        return [loop]
+    context.count(PASS_NAME, "partially_unrolled")
+    condition = BinaryOp(induction.op, Var(induction.variable), IntLit(last_bound))
+    body = [copy_tree(statement) for _ in range(factor) for statement in loop.body]
+    if trips is not None and trips % factor == 0:
+        return [WhileStmt(condition, body)]  # no iterations remain
+    return [WhileStmt(condition, body), loop]
+
+
+def _induction_variable(loop: WhileStmt) -> Optional[InductionVariable]:
+    condition = loop.condition
+    if type(condition) is not BinaryOp or condition.op not in SWAPPED:
+        return None
+    left, right, op = condition.left, condition.right, condition.op
+    if type(left) is not Var:
+        left, right, op = right, left, SWAPPED[op]
+    if type(left) is not Var or type(right) not in (IntLit, Var) or (type(right) is Var and right.name == left.name):
+        return None
+    variable = left.name
+
+    steps = [statement for statement in loop.body if type(statement) is AssignStmt and statement.name == variable]
+    if len(steps) != 1:
+        return None
+    stores = sum(1 for node, _ in walk(loop)
+                 if (type(node) is LetStmt or type(node) is AssignStmt) and node.name == variable)
+    step = _step(steps[0].expr, variable)
+    if stores != 1 or step is None:
+        return None
+    return InductionVariable(variable, op, right, step)
+
+
+def _step(expr: ASTNode, variable: str) -> Optional[int]:
+    """c for `variable + c`, `c + variable` or `variable - c` with a non-zero literal c."""
+    if type(expr) is not BinaryOp or expr.op not in ("+", "-"):
+        return None
+    left, right = expr.left, expr.right
+    if expr.op == "+" and type(left) is IntLit and type(right) is Var:
+        left, right = right, left
+    if type(left) is not Var or left.name != variable or type(right) is not IntLit:
+        return None
+    step = wrap32(right.value if expr.op == "+" else -right.value)
+    return step or None
+
+
+def _trip_count(op: str, start: int, bound: int, step: int) -> Optional[int]:
+    """How often the loop runs from start, or None if more than MAX_FULL_UNROLL times."""
+    value = start
+    for trips in range(MAX_FULL_UNROLL + 1):
+        if not evaluate_binary(op, value, bound):
+            return trips
+        value = wrap32(value + step)
+    return None
+
+
+def _copies(body: List[ASTNode], count: int) -> List[ASTNode]:
+    """count copies of the body's statements, the last one reusing the original nodes."""
+    statements = []
+    for _ in range(count - 1):
+        statements.extend(copy_tree(statement) for statement in body)
+    if count:
+        statements.extend(body)
+    return statements
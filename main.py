@@ -1,30 +1,117 @@
+import argparse
+import json
+import os
 import sys
-from lexer import lexer
-from parser_1 import Parser
-from ast_lib import print_ast
-from code_generator import CodeGenerator
+from batch import compile_batch, default_workers
+from cache import CACHE_DIR_ENV_VAR, DEFAULT_MAX_BYTES
+from options import DEFAULT_UNROLL_FACTOR, OPT_LEVELS, CompileOptions, check_pass_names, parse_pass_flags
+from paths import DEFAULT_OUTPUT, expand_inputs, output_paths
+from timing import format_report
+from tracing import trace, PHASES, TRACE_ENV_VAR
+
+
+def parse_args(argv):
+    arg_parser = argparse.ArgumentParser(
+        description=f"Compile source files to x86 assembly. A single input is written to {DEFAULT_OUTPUT} "
+                    f"(or -o); several inputs are each written to <name>.asm beside the input (or in --out-dir).")
+    arg_parser.add_argument("inputs", nargs="*", metavar="input",
+                            help="source files or glob patterns, e.g. 'src/**/*.txt'")
+    arg_parser.add_argument("-o", "--output", help=f"output file for a single input (default: {DEFAULT_OUTPUT})")
+    arg_parser.add_argument("--out-dir", help="write <name>.asm for each input into this directory")
+    arg_parser.add_argument("-j", "--jobs", type=int, default=default_workers(),
+                            help="number of worker processes (default: one per available core)")
+    arg_parser.add_argument("-O", dest="opt_level", type=int, choices=OPT_LEVELS, default=0,
+                            help="optimization level: -O0 (default) runs no passes, -O1 and -O2 run more")
+    arg_parser.add_argument("-f", dest="pass_flags", action="append", default=[], metavar="[no-]PASS",
+                            help="turn an optimization pass on (-fPASS) or off (-fno-PASS) regardless of -O")
+    arg_parser.add_argument("--unroll-factor", type=int, default=DEFAULT_UNROLL_FACTOR, metavar="N",
+                            help=f"iterations per trip of a partially unrolled loop (default: {DEFAULT_UNROLL_FACTOR}; "
+                                 f"1 unrolls only loops it can unroll completely)")
+    arg_parser.add_argument("--verify-passes", action="store_true",
+                            help="check the AST for consistency after every optimization pass")
+    arg_parser.add_argument("--list-passes", action="store_true", help="list the optimization passes and exit")
+    arg_parser.add_argument("--trace", metavar="SPEC",
+                            help=f"trace compiler phases, e.g. 'parse' or 'lex,codegen:2' "
+                                 f"(phases: all, {', '.join(PHASES)}; overrides ${TRACE_ENV_VAR})")
+    arg_parser.add_argument("--cache-dir", default=os.environ.get(CACHE_DIR_ENV_VAR),
+                            help=f"reuse generated assembly and parsed ASTs of unchanged sources from this directory "
+                                 f"(default: ${CACHE_DIR_ENV_VAR}; caching is off when neither is set)")
+    arg_parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                            help="evict least recently used entries once a cache grows beyond this size")
+    arg_parser.add_argument("--no-cache", action="store_true", help="ignore --cache-dir and $" + CACHE_DIR_ENV_VAR)
+    arg_parser.add_argument("--cache-stats", action="store_true", help="report cache hits and misses on stderr")
+    arg_parser.add_argument("--time-passes", action="store_true",
+                            help="report wall/CPU time and peak memory per phase, plus token, node and "
+                                 "instruction counts, on stderr")
+    arg_parser.add_argument("--time-passes-json", metavar="PATH",
+                            help="write the --time-passes report for every input to PATH as JSON")
+    args = arg_parser.parse_args(argv)
+    if not args.inputs and not args.list_passes:
+        arg_parser.error("no input files")
+    if args.jobs < 1:
+        arg_parser.error("--jobs must be at least 1")
+    if args.unroll_factor < 1:
+        arg_parser.error("--unroll-factor must be at least 1")
+    return arg_parser, args
 
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python main.py <input_file>")
+    arg_parser, args = parse_args(sys.argv[1:])
+    if args.trace is not None:
+        try:
+            trace.configure(args.trace)
+        except ValueError as error:
+            arg_parser.error(f"--trace: {error}")
+
+    if args.list_passes:
+        from passes import PIPELINE
+        width = max(len(optimization.name) for optimization in PIPELINE)
+        for optimization in PIPELINE:
+            print(f"{optimization.name:<{width}}  -O{optimization.level}  {optimization.description}")
+        return
+
+    enable, disable = parse_pass_flags(args.pass_flags)
+    try:
+        check_pass_names(enable | disable)
+    except ValueError as error:
+        arg_parser.error(str(error))
+    options = CompileOptions(opt_level=args.opt_level, enable=enable, disable=disable,
+                             unroll_factor=args.unroll_factor, verify=args.verify_passes)
+
+    try:
+        inputs = expand_inputs(args.inputs)
+        outputs = output_paths(inputs, args.output, args.out_dir)
+    except ValueError as error:
+        arg_parser.error(str(error))
+    if args.out_dir is not None:
+        os.makedirs(args.out_dir, exist_ok=True)
+
+    cache_dir = args.cache_dir if not args.no_cache else None
+    results, cache_stats = compile_batch(list(zip(inputs, outputs)), options, cache_dir,
+                                         args.cache_max_mb * 1024 * 1024, args.jobs, args.trace,
+                                         args.time_passes or args.time_passes_json is not None)
+
+    failed = [result for result in results if not result.ok]
+    for result in results:
+        for warning in result.warnings:
+            sys.stderr.write(f"{result.input_file}: warning: {warning}\n")
+        if not result.ok:
+            sys.stderr.write(f"{result.input_file}: error: {result.error}\n")
+    if len(results) > 1:
+        sys.stderr.write(f"compiled {len(results) - len(failed)} of {len(results)} files\n")
+    if args.cache_stats:
+        for namespace, stats in cache_stats.items():
+            sys.stderr.write(stats.format(namespace) + "\n")
+    if args.time_passes:
+        for result in results:
+            if result.timing is not None:
+                sys.stderr.write(format_report(result.input_file, result.timing) + "\n")
+    if args.time_passes_json is not None:
+        report = {result.input_file: result.timing for result in results if result.timing is not None}
+        with open(args.time_passes_json, "w") as file:
+            json.dump(report, file, indent=2)
+    if failed:
         sys.exit(1)
-    
-    input_file = sys.argv[1]
-    
-    # Step 1: Lexical analysis
-    tokens = lexer(input_file)
-    
-    # Step 2: Parsing
-    parser = Parser(tokens)
-    ast = parser.parse()
-
-    generator = CodeGenerator(ast)
-    generator.write_to_file("output.asm")
-        
-    # Step 3: Output the AST
-    print("\nGenerated AST:")
-    print_ast(ast)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,79 @@
+# Assembly dialect and object format the code generator emits (nasm -f elf, ld -m elf_i386).
+DEFAULT_TARGET = "elf32-i386"
+OPT_LEVELS = (0, 1, 2)
+# How many iterations the loop-unrolling pass puts in one trip of a partially unrolled loop.
+DEFAULT_UNROLL_FACTOR = 4
+# The optimization passes of passes.PIPELINE, in order. Kept here so that checking -f flags
+# does not import the passes themselves; passes.py checks the two agree.
+PASS_NAMES = ("constant-folding", "loop-unrolling", "constant-propagation", "dead-code-elimination",
+              "loop-invariant-code-motion", "register-allocation", "strength-reduction", "peephole")
+
+
+def parse_pass_flags(flags):
+    """Split -f flags into (enable, disable) pass name sets; for a pass named twice the last flag wins."""
+    enable, disable = set(), set()
+    for flag in flags:
+        if flag.startswith("no-"):
+            enable.discard(flag[3:])
+            disable.add(flag[3:])
+        else:
+            disable.discard(flag)
+            enable.add(flag)
+    return enable, disable
+
+
+def check_pass_names(names):
+    """Raise ValueError naming any pass that does not exist."""
+    unknown = sorted(set(names) - set(PASS_NAMES))
+    if unknown:
+        raise ValueError(f"unknown optimization pass(es): {', '.join(unknown)} (known passes: {', '.join(PASS_NAMES)})")
+
+
+class CompileOptions:
+    """Settings that change the generated assembly.
+
+    Anything that can change the output belongs here, because cache_token() is part
+    of the output cache key: two compilations with equal tokens must produce the same
+    .asm for the same source. opt_level picks the -O preset of optimization passes;
+    enable/disable name passes switched on or off on top of it (-f<pass>,
+    -fno-<pass>). unroll_factor is how many iterations loop-unrolling fuses when it
+    cannot unroll a loop completely; 1 turns partial unrolling off. verify checks
+    the tree after every pass; it cannot change the output, so it is left out of
+    the cache token.
+    """
+
+    __slots__ = ("target", "opt_level", "enable", "disable", "unroll_factor", "verify")
+
+    def __init__(self, target: str = DEFAULT_TARGET, opt_level: int = 0, enable=(), disable=(),
+                 unroll_factor: int = DEFAULT_UNROLL_FACTOR, verify: bool = False):
+        if opt_level not in OPT_LEVELS:
+            raise ValueError(f"invalid optimization level {opt_level!r} (expected one of {OPT_LEVELS})")
+        if type(unroll_factor) is not int or unroll_factor < 1:
+            raise ValueError(f"invalid unroll factor {unroll_factor!r} (expected a positive integer)")
+        self.target = target
+        self.opt_level = opt_level
+        self.enable = frozenset(enable)
+        self.disable = frozenset(disable)
+        self.unroll_factor = unroll_factor
+        self.verify = verify
+
+    @classmethod
+    def from_dict(cls, values: dict) -> "CompileOptions":
+        unknown = set(values) - set(cls.__slots__)
+        if unknown:
+            raise ValueError(f"unknown compile options: {', '.join(sorted(unknown))}")
+        return cls(**values)
+
+    def as_dict(self) -> dict:
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values["enable"] = sorted(self.enable)
+        values["disable"] = sorted(self.disable)
+        return values
+
+    def cache_token(self) -> str:
+        return (f"target={self.target};O={self.opt_level};"
+                f"enable={','.join(sorted(self.enable))};disable={','.join(sorted(self.disable))};"
+                f"unroll={self.unroll_factor}")
+
+    def __repr__(self):
+        return f"CompileOptions({self.cache_token()})"
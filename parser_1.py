@@ -1,96 +1,86 @@
-from typing import List
-from ast_lib import ASTNode, NodeType
-from lexer import Token, END_OF_TOKENS, KEYWORD, SEPARATOR, INT, OPERATOR, STRING, IDENTIFIER, UNKNOWN
+from typing import Iterable
+from ast_lib import (ASTNode, AssignStmt, ExitStmt, FunctionCall, IfStmt, LetStmt, PrintStmt,
+                     ProcessorStmt, Program, StringLit, WhileStmt)
+from lexer import Token, TokenStream, END_OF_TOKENS, KEYWORD, SEPARATOR, OPERATOR, STRING, IDENTIFIER, UNKNOWN
+from errors import ParseError
 from expressions import ExpressionParser
+from tracing import trace
 
 class Parser:
-    def __init__(self, tokens: List[Token]):
-        self.tokens = tokens
-        self.pos = -1
-        self.current_token = None
-        self.advance()
+    def __init__(self, tokens: Iterable[Token]):
+        self.stream = tokens if isinstance(tokens, TokenStream) else TokenStream(tokens)
+        self.expressions = ExpressionParser(self.stream)
+        self.depth = 0  # if/while blocks open around the current token
+
+    @property
+    def current_token(self):
+        return self.stream.current
 
     def advance(self):
-        self.pos += 1
-        if self.pos < len(self.tokens):
-            self.current_token = self.tokens[self.pos]
-        else:
-            self.current_token = None
-        return self.current_token
+        return self.stream.advance()
 
-    def parse(self) -> ASTNode:
-        program_node = ASTNode(NodeType.PROGRAM, "PROGRAM")
+    def parse_expression(self) -> ASTNode:
+        """Parse an expression in place on the shared token cursor."""
+        return self.expressions.parse_expression()
+
+    def parse(self) -> Program:
+        try:
+            return self._parse_statements()
+        except RecursionError:
+            # Expressions are parsed without recursion, but each nested if/while block takes a few frames
+            raise ParseError(f"if/while blocks nested too deeply ({self.depth} levels)") from None
+
+    def _parse_statements(self) -> Program:
         statements = []
 
-        print("\nParsing statements:")
+        tracing = trace.parse
         while self.current_token and self.current_token.type != END_OF_TOKENS:
             if self.current_token.type == KEYWORD and self.current_token.value == "EXIT":
                 stmt = self.parse_exit_statement()
-                print(f"Parsed EXIT statement")
             elif self.current_token.type == KEYWORD and self.current_token.value == "PRINT":
                 stmt = self.parse_print_statement()
-                print(f"Parsed PRINT statement")
             elif self.current_token.type == KEYWORD and self.current_token.value == "LET":
                 stmt = self.parse_let_statement()
-                print(f"Parsed LET statement: {stmt.left.value} = {stmt.right.value if stmt.right else 'None'}")
             elif self.current_token.type == KEYWORD and self.current_token.value == "IF":
                 stmt = self.parse_if_statement()
-                print(f"Parsed IF statement")
             elif self.current_token.type == KEYWORD and self.current_token.value == "ELSE":
                 self.advance()
                 continue
             elif self.current_token.type == KEYWORD and self.current_token.value == "WHILE":
                 stmt = self.parse_while_stmt()
-                print(f"Parsed WHILE statement")
             elif self.current_token.type == KEYWORD and self.current_token.value == "ASSIGN":
                 stmt = self.parse_assign_statement()
-                print(f"Parsed ASSIGN statement")
             elif self.current_token.type == KEYWORD and self.current_token.value == "PROCESSOR":
                 stmt, num_args = self.parse_processor_statement()
-                print(f"Parsed PROCESSOR statement")
             elif self.current_token.type == KEYWORD and self.current_token.value == "CALL":
                 stmt = self.parse_function_call()
-                print(f"Parsed FUNCTION CALL statement")
             else:
-                print(f"Unexpected token: {self.current_token.value}")
-                exit(1)
+                raise ParseError(f"Unexpected token: {self.current_token.value}")
 
             statements.append(stmt)
+            if tracing:
+                trace.log("parse", f"Parsed {stmt.type.name} statement")
 
-        # Link statements in order
-        print("\nLinking statements:")
-        for i in range(len(statements) - 1):
-            statements[i].next_node = statements[i + 1]
-            print(f"Linked statement {i} to {i+1}")
-        
-        if statements:
-            program_node.right = statements[0]
-            print(f"Linked first statement to program node")
+        if tracing >= 2:
+            trace.log("parse", f"Parsed {len(statements)} statements")
 
-        return program_node
+        return Program(statements)
     
     def parse_while_stmt(self):
-        while_node = ASTNode(NodeType.WHILE_STMT, "WHILE_STMT")
-        self.advance()
+        self.depth += 1  # left as it is on errors, so parse() can report it
+        self.advance()  # consume WHILE
         if self.current_token.value != '(':
-            print("expected opening bracket after while")
-            exit(1)
+            raise ParseError("expected opening bracket after while")
         self.advance()
 
-        parser_exp = ExpressionParser(self.tokens, self.pos)
-        condition_node, new_pos = parser_exp.parse_expression()
-        self.pos = new_pos
-        self.current_token = self.tokens[self.pos] if self.pos < len(self.tokens) else None
-        while_node.left = condition_node 
-        
+        condition_node = self.parse_expression()
+
         if self.current_token.value != ')':
-            print("expected closing bracket after while")
-            exit(1)
+            raise ParseError("expected closing bracket after while")
         self.advance()
         
         if self.current_token.value != '{':
-            print(f"expected opening curly bracket after while, got '{self.current_token.value}'")
-            exit(1)
+            raise ParseError(f"expected opening curly bracket after while, got '{self.current_token.value}'")
         self.advance()
 
         # Parse while loop body
@@ -123,111 +113,76 @@ class Parser:
             elif self.current_token.type == SEPARATOR and self.current_token.value == ';':
                 self.advance()
             else:
-                print(f"Unexpected token in while body: {self.current_token.value}")
-                exit(1)
+                raise ParseError(f"Unexpected token in while body: {self.current_token.value}")
         
-        # Link while body statements
-        if body_statements:
-            while_node.right = body_statements[0]
-            for i in range(len(body_statements) - 1):
-                body_statements[i].next_node = body_statements[i + 1]
-        
-        return while_node
+        self.depth -= 1
+        return WhileStmt(condition_node, body_statements)
     
     def parse_processor_stmt(self):
-        processor_node = ASTNode(NodeType.PROCESSOR_STMT, "PROCESSOR_STMT")
         self.advance()
         if self.current_token.type != IDENTIFIER:
-            print("expected an identifier")
-            exit(1)
-        processor_node.left = ASTNode(NodeType.IDENTIFIER, self.current_token.value)
+            raise ParseError("expected an identifier")
+        name = self.current_token.value
         self.advance()
         if self.current_token.type != SEPARATOR or self.current_token.value != '(':
-            print("expected opening bracket after function definition")
-            exit(1)
+            raise ParseError("expected opening bracket after function definition")
         self.advance()
-        prev_node = None
-        num_args = 0
+        params = []
         while(self.current_token.type != SEPARATOR or self.current_token.value != ')'):
             if self.current_token.type != IDENTIFIER:
-                print("expected an identifier")
-                exit(1)
-            if prev_node is not None:
-                prev_node.next_node = ASTNode(NodeType.IDENTIFIER, self.current_token.value)
-                prev_node = prev_node.next_node
-            else:
-                processor_node.left.next_node = ASTNode(NodeType.IDENTIFIER, self.current_token.value)
-                prev_node = processor_node.left.next_node
-            num_args += 1
+                raise ParseError("expected an identifier")
+            params.append(self.current_token.value)
             self.advance()
         if self.current_token.type != SEPARATOR or self.current_token.value != ')':
-            print("expected closing bracket after function definition")
-            exit(1)
+            raise ParseError("expected closing bracket after function definition")
         self.advance()
-        processor_node.right = self.parse()
-        
-        return processor_node, num_args
+        body = self.parse().body
+
+        return ProcessorStmt(name, params, body), len(params)
 
     def parse_let_statement(self):
-        let_node = ASTNode(NodeType.LET_STMT, "LET_STMT")
         self.advance()  # consume LET
 
         if self.current_token.type != IDENTIFIER:
-            print("expected an identifier")
-            exit(1)
-        let_node.left = ASTNode(NodeType.IDENTIFIER, self.current_token.value)
-        print(f"  LET statement identifier: {self.current_token.value}")
+            raise ParseError("expected an identifier")
+        name = self.current_token.value
+        if trace.parse >= 2:
+            trace.log("parse", f"  LET statement identifier: {self.current_token.value}")
         self.advance()
 
         if self.current_token.type != OPERATOR or self.current_token.value != '=':
-            print("expected '=' after identifier")
-            exit(1)
+            raise ParseError("expected '=' after identifier")
         self.advance()
 
         # Parse the expression value
-        parser_exp = ExpressionParser(self.tokens, self.pos)
-        value_node, new_pos = parser_exp.parse_expression()
-        self.pos = new_pos
-        print(f"  LET statement expression: {value_node.type} {value_node.value}")
-
-        self.current_token = self.tokens[self.pos] if self.pos < len(self.tokens) else None
-
-        # Set the right child to the value node
-        let_node.right = value_node
+        value_node = self.parse_expression()
+        if trace.parse >= 2:
+            trace.log("parse", f"  LET statement expression: {value_node.type}")
 
         if self.current_token.type != SEPARATOR or self.current_token.value != ';':
-            print("expected ';' after let statement")
-            exit(1)
+            raise ParseError("expected ';' after let statement")
         self.advance()  # consume ';'
 
-        return let_node
+        return LetStmt(name, value_node)
     
     def parse_if_statement(self):
-        if_node = ASTNode(NodeType.IF_STMT, "IF")
+        self.depth += 1  # left as it is on errors, so parse() can report it
         self.advance()  # consume IF
 
         # Parse condition
         if self.current_token.value != '(':
-            print("expected opening bracket after if")
-            exit(1)
+            raise ParseError("expected opening bracket after if")
         self.advance()  # consume '('
 
-        parser_exp = ExpressionParser(self.tokens, self.pos)
-        condition_node, new_pos = parser_exp.parse_expression()
-        self.pos = new_pos
-        self.current_token = self.tokens[self.pos] if self.pos < len(self.tokens) else None
-
-        if_node.left = condition_node
+        condition_node = self.parse_expression()
 
         if self.current_token.value != ')':
-            print("expected closing bracket after if condition")
-            exit(1)
+            raise ParseError("expected closing bracket after if condition")
         self.advance()  # consume ')'
 
         # Expect opening brace
         if self.current_token.value != '{':
-            print("expected opening brace after if condition")
-            exit(1)
+            raise ParseError("expected opening brace after if condition")
         self.advance()  # consume '{'
 
         # Parse then block
@@ -262,25 +217,19 @@ class Parser:
             elif self.current_token.type == SEPARATOR and self.current_token.value == ';':
                 self.advance()
             else:
-                print(f"Unexpected token in then block: {self.current_token.value}")
-                exit(1)
+                raise ParseError(f"Unexpected token in then block: {self.current_token.value}")
 
-        print(f"Then block statements: {then_statements}")
-
-        # Link then block statements
-        if then_statements:
-            if_node.right = then_statements[0]
-            for i in range(len(then_statements) - 1):
-                then_statements[i].next_node = then_statements[i + 1]
+        if trace.parse >= 2:
+            trace.log("parse", f"Then block statements: {then_statements}")
 
         # Check for else block
+        else_statements = []
         if self.current_token and self.current_token.type == KEYWORD and self.current_token.value == "ELSE":
             self.advance()  # consume ELSE
             
             # Expect opening brace after ELSE
             if self.current_token.value != '{':
-                print("expected opening brace after ELSE")
-                exit(1)
+                raise ParseError("expected opening brace after ELSE")
             self.advance()  # consume '{'
             
             # Parse else block
@@ -315,102 +264,74 @@ class Parser:
                 elif self.current_token.type == SEPARATOR and self.current_token.value == ';':
                     self.advance()
                 else:
-                    print(f"Unexpected token in else block: {self.current_token.value}")
-                    exit(1)
-
-            print(f"Else block statements: {else_statements}")
+                    raise ParseError(f"Unexpected token in else block: {self.current_token.value}")
 
-            # Link else block statements
-            if else_statements:
-                if_node.else_node = else_statements[0]
-                for i in range(len(else_statements) - 1):
-                    else_statements[i].next_node = else_statements[i + 1]
+            if trace.parse >= 2:
+                trace.log("parse", f"Else block statements: {else_statements}")
 
-        print(f"Final if node structure: {if_node}")
+        self.depth -= 1
+        if_node = IfStmt(condition_node, then_statements, else_statements)
+        if trace.parse >= 2:
+            trace.log("parse", f"Final if node structure: {if_node}")
         return if_node
 
     def parse_exit_statement(self):
-        exit_node = ASTNode(NodeType.EXIT_STMT, "EXIT")
         self.advance()  # consume EXIT
 
         if self.current_token.value != "(":
-            print("expected '(' after EXIT")
-            exit(1)
+            raise ParseError("expected '(' after EXIT")
         self.advance()  # consume '('
 
         # Parse the expression argument
-        parser_exp = ExpressionParser(self.tokens, self.pos)
-        arg_node, new_pos = parser_exp.parse_expression()
-        self.pos = new_pos
-        self.current_token = self.tokens[self.pos] if self.pos < len(self.tokens) else None
-
-        # Set the left child to the argument node
-        exit_node.left = arg_node
+        arg_node = self.parse_expression()
 
         if self.current_token.value != ")":
-            print("expected ')' after EXIT argument")
-            exit(1)
+            raise ParseError("expected ')' after EXIT argument")
         self.advance()  # consume ')'
 
         if self.current_token.value != ";":
-            print("expected ';' after EXIT statement")
-            exit(1)
+            raise ParseError("expected ';' after EXIT statement")
         self.advance()  # consume ';'
 
-        return exit_node
+        return ExitStmt(arg_node)
     
     def parse_assign_statement(self):
-        assign_node = ASTNode(NodeType.ASSIGN_STMT, "ASSIGN_STMT")
         self.advance()  # consume ASSIGN
         
         if self.current_token.type != IDENTIFIER:
-            print("expected an identifier")
-            exit(1)
-        assign_node.left = ASTNode(NodeType.IDENTIFIER, self.current_token.value)
+            raise ParseError("expected an identifier")
+        name = self.current_token.value
         self.advance()
         
         if self.current_token.type != OPERATOR or self.current_token.value != '=':
-            print("expected '=' after identifier")
-            exit(1)
+            raise ParseError("expected '=' after identifier")
         self.advance()
         
-        parser_exp = ExpressionParser(self.tokens, self.pos)
-        new_val, new_pos = parser_exp.parse_expression()
-        self.pos = new_pos
-        assign_node.right = new_val
-        
-        self.current_token = self.tokens[self.pos] if self.pos < len(self.tokens) else None
+        new_val = self.parse_expression()
 
         if self.current_token.type != SEPARATOR or self.current_token.value != ';':
-            print("expected ';' after assign statement")
-            exit(1)
+            raise ParseError("expected ';' after assign statement")
         self.advance()  # consume ';'
         
-        return assign_node
+        return AssignStmt(name, new_val)
     
     def parse_function_call(self):
-        call_node = ASTNode(NodeType.FUNCTION_CALL, "FUNCTION_CALL")
         self.advance()  # consume CALL
         
         if self.current_token.type != IDENTIFIER:
-            print("expected function name after CALL")
-            exit(1)
-        call_node.function_name = self.current_token.value
+            raise ParseError("expected function name after CALL")
+        function_name = self.current_token.value
         self.advance()
         
         if self.current_token.type != SEPARATOR or self.current_token.value != '(':
-            print("expected opening bracket after function name")
-            exit(1)
+            raise ParseError("expected opening bracket after function name")
         self.advance()
         
         # Parse arguments
         args = []
         if self.current_token.type != SEPARATOR or self.current_token.value != ')':
             while True:
-                parser_exp = ExpressionParser(self.tokens, self.pos)
-                arg_node, new_pos = parser_exp.parse_expression()
-                self.pos = new_pos
-                self.current_token = self.tokens[self.pos] if self.pos < len(self.tokens) else None
+                arg_node = self.parse_expression()
                 args.append(arg_node)
                 
                 if self.current_token.type == SEPARATOR and self.current_token.value == ')':
@@ -418,52 +339,38 @@ class Parser:
                 elif self.current_token.type == SEPARATOR and self.current_token.value == ',':
                     self.advance()  # consume comma
                 else:
-                    print("expected ',' or ')' in function call arguments")
-                    exit(1)
-        
-        call_node.args = args
+                    raise ParseError("expected ',' or ')' in function call arguments")
         
         if self.current_token.type != SEPARATOR or self.current_token.value != ')':
-            print("expected closing bracket after function arguments")
-            exit(1)
+            raise ParseError("expected closing bracket after function arguments")
         self.advance()
         
         if self.current_token.type != SEPARATOR or self.current_token.value != ';':
-            print("expected ';' after function call")
-            exit(1)
+            raise ParseError("expected ';' after function call")
         self.advance()
         
-        return call_node
+        return FunctionCall(function_name, args)
         
 
     def parse_print_statement(self):
-        print_node = ASTNode(NodeType.PRINT_STMT, "PRINT_STMT")
         self.advance()  # consume PRINT
 
         if self.current_token.value != "(":
-            print("expected '(' after PRINT")
-            exit(1)
+            raise ParseError("expected '(' after PRINT")
         self.advance()  # consume '('
 
         if self.current_token.type in [STRING, UNKNOWN]:  # Handle both STRING and UNKNOWN types as string literals
-            string_node = ASTNode(NodeType.STRING_LIT, self.current_token.value)
+            arg_node = StringLit(self.current_token.value)
             self.advance()
-            print_node.left = string_node
         else:
-            parser_exp = ExpressionParser(self.tokens, self.pos)
-            parsed, new_pos = parser_exp.parse_expression()
-            self.pos = new_pos
-            self.current_token = self.tokens[self.pos] if self.pos < len(self.tokens) else None
-            print_node.left = parsed
+            arg_node = self.parse_expression()
 
         if self.current_token.value != ")":
-            print("expected ')' after PRINT argument")
-            exit(1)
+            raise ParseError("expected ')' after PRINT argument")
         self.advance()  # consume ')'
 
         if self.current_token.value != ";":
-            print("expected ';' after PRINT statement")
-            exit(1)
+            raise ParseError("expected ';' after PRINT statement")
         self.advance()  # consume ';'
 
-        return print_node
+        return PrintStmt(arg_node)
@@ -0,0 +1,210 @@
+from typing import Callable, List, Optional
+
+from ast_lib import (ASTNode, AssignStmt, BinaryOp, BoolLit, ExitStmt, FunctionCall, IfStmt, IntLit, LetStmt,
+                     PrintStmt, ProcessorStmt, Program, StringLit, UnaryOp, Var, WhileStmt, initial_values)
+from constant_folding import fold_constants, propagate_constants
+from dead_code import eliminate_dead_code
+from errors import Diagnostic, VerificationError
+from loop_invariants import hoist_loop_invariants
+from loop_unrolling import unroll_loops
+from options import PASS_NAMES, CompileOptions, check_pass_names
+from peephole import peephole
+from register_allocation import allocate_registers
+from strength_reduction import reduce_strength
+from timing import PhaseTimer, phase
+from tracing import trace
+
+
+AST_STAGE = "ast"
+ASM_STAGE = "asm"
+
+
+class PassContext:
+    """State shared by the passes of one compilation.
+
+    Passes append warnings to `diagnostics` and count what they changed in
+    `stats[pass_name]` (e.g. {"folded": 3}); both end up in the CompileResult.
+    `registers` maps variables to the register the code generator keeps them in;
+    empty, every variable lives in its memory slot. `reductions` maps the ids of
+    `*` and `/` nodes to the cheaper code to emit for them (see strength_reduction.py).
+    `initial_values` holds the variables' values before the program runs, taken
+    from the parsed tree: passes may fold, rewrite or drop the `let`s they come from.
+    """
+
+    __slots__ = ("options", "diagnostics", "stats", "registers", "reductions", "initial_values")
+
+    def __init__(self, options: CompileOptions):
+        self.options = options
+        self.diagnostics = []
+        self.stats = {}
+        self.registers = {}
+        self.reductions = {}
+        self.initial_values = {}
+
+    def warn(self, message: str):
+        """Add a warning, once: several passes may rediscover the same problem."""
+        if all(diagnostic.message != message for diagnostic in self.diagnostics):
+            self.diagnostics.append(Diagnostic(Diagnostic.WARNING, message))
+
+    def count(self, pass_name: str, what: str, amount: int = 1):
+        counts = self.stats.setdefault(pass_name, {})
+        counts[what] = counts.get(what, 0) + amount
+
+
+class OptimizationPass:
+    """A named transformation, enabled from -O`level` upwards.
+
+    AST-stage passes run before code generation: `run(program, context)` may
+    rewrite the tree in place or build a new one, and the returned Program is
+    what the next pass sees. Assembly-stage passes run after it, as
+    `run(asm, context)` returning the new assembly text.
+    """
+
+    __slots__ = ("name", "level", "run", "description", "stage")
+
+    def __init__(self, name: str, level: int, run: Callable, description: str, stage: str = AST_STAGE):
+        self.name = name
+        self.level = level
+        self.run = run
+        self.description = description
+        self.stage = stage
+
+
+# The pipeline, in execution order. -O<n> runs every pass whose level is <= n.
+# register-allocation describes the final tree, so it stays last of the AST passes that
+# change it (strength-reduction only annotates it);
+# loop-unrolling runs before constant-propagation, which folds the unrolled copies.
+PIPELINE: List[OptimizationPass] = [
+    OptimizationPass("constant-folding", 1, fold_constants,
+                     "evaluate operators on literal operands with 32-bit wraparound"),
+    OptimizationPass("loop-unrolling", 2, unroll_loops,
+                     "replace short counting loops by copies of their body, unroll longer ones by --unroll-factor"),
+    OptimizationPass("constant-propagation", 1, propagate_constants,
+                     "substitute known variable values through straight-line code, ifs and loops, and fold"),
+    OptimizationPass("dead-code-elimination", 1, eliminate_dead_code,
+                     "remove unreachable code, statically decided branches and loops, and dead stores"),
+    OptimizationPass("loop-invariant-code-motion", 2, hoist_loop_invariants,
+                     "compute expressions a while loop does not change once, before the loop"),
+    OptimizationPass("register-allocation", 1, allocate_registers,
+                     "keep the most used variables in esi, edi and ebp instead of memory"),
+    OptimizationPass("strength-reduction", 1, reduce_strength,
+                     "multiply and divide by literals with shifts, lea and magic reciprocals instead of imul/idiv"),
+    OptimizationPass("peephole", 1, peephole,
+                     "rewrite redundant moves, push/pop pairs, compares and jumps in the emitted code", ASM_STAGE),
+]
+PASSES = {optimization.name: optimization for optimization in PIPELINE}
+if tuple(PASSES) != PASS_NAMES:
+    raise ImportError("options.PASS_NAMES does not match passes.PIPELINE")
+
+
+def select_passes(options: CompileOptions) -> List[OptimizationPass]:
+    """The passes the options turn on, in pipeline order."""
+    check_pass_names(options.enable | options.disable)
+    return [optimization for optimization in PIPELINE
+            if optimization.name not in options.disable
+            and (optimization.level <= options.opt_level or optimization.name in options.enable)]
+
+
+def run_passes(program: Program, options: CompileOptions, timer: Optional[PhaseTimer] = None) -> tuple:
+    """Run the selected passes over the tree; returns (program, context).
+
+    With options.verify the tree is checked before the first pass and after each
+    one, so a pass that breaks an invariant is named straight away.
+    """
+    context = PassContext(options)
+    context.initial_values = initial_values(program)
+    selected = [optimization for optimization in select_passes(options) if optimization.stage == AST_STAGE]
+    if options.verify and selected:
+        with phase(timer, "verify"):
+            verify_ast(program, "the parser")
+    for optimization in selected:
+        with phase(timer, f"pass:{optimization.name}"):
+            program = optimization.run(program, context)
+        if trace.opt:
+            trace.log("opt", f"{optimization.name}: {context.stats.get(optimization.name, {})}")
+        if options.verify:
+            with phase(timer, "verify"):
+                verify_ast(program, f"pass '{optimization.name}'")
+    return program, context
+
+
+def run_asm_passes(asm: str, context: PassContext, timer: Optional[PhaseTimer] = None) -> str:
+    """Run the selected assembly-stage passes over the generated code, after run_passes."""
+    for optimization in select_passes(context.options):
+        if optimization.stage != ASM_STAGE:
+            continue
+        with phase(timer, f"pass:{optimization.name}"):
+            asm = optimization.run(asm, context)
+        if trace.opt:
+            trace.log("opt", f"{optimization.name}: {context.stats.get(optimization.name, {})}")
+    return asm
+
+
+# Node classes allowed in statement and in expression position.
+STATEMENT_CLASSES = (LetStmt, AssignStmt, PrintStmt, ExitStmt, IfStmt, WhileStmt, FunctionCall, ProcessorStmt)
+EXPRESSION_CLASSES = (IntLit, BoolLit, StringLit, Var, BinaryOp, UnaryOp)
+# Child fields holding a statement list (FunctionCall.args holds expressions).
+STATEMENT_LIST_FIELDS = frozenset(("body", "then_body", "else_body"))
+BINARY_OPERATORS = frozenset(("+", "-", "*", "/", "<", "<=", ">", ">=", "==", "!=", "&&", "||"))
+UNARY_OPERATORS = frozenset(("-", "!"))
+
+
+def verify_ast(program: Program, producer: str):
+    """Check the tree's structural invariants, raising VerificationError on the first violation.
+
+    Statements may only appear in statement lists and expressions only in
+    expression slots; every field is of the expected kind; operators are known;
+    and no node object appears twice, since passes that rewrite a shared subtree
+    would silently change both uses.
+    """
+    def fail(message):
+        raise VerificationError(f"malformed tree after {producer}: {message}")
+
+    if type(program) is not Program:
+        fail(f"root is {type(program).__name__}, not Program")
+    seen = set()
+    # (node, expected kinds) pairs; the root's body is checked like any statement list
+    stack = [(program, Program)]
+    while stack:
+        node, expected = stack.pop()
+        if not isinstance(node, expected):
+            fail(f"{type(node).__name__} where {_kind(expected)} was expected")
+        if id(node) in seen:
+            fail(f"{type(node).__name__} node appears twice in the tree")
+        seen.add(id(node))
+        for name in node.__slots__:
+            if not hasattr(node, name):
+                fail(f"{type(node).__name__}.{name} is not set")
+        _verify_fields(node, fail)
+        for name in node.children:
+            child = getattr(node, name)
+            if name in STATEMENT_LIST_FIELDS or name == "args":
+                if type(child) is not list:
+                    fail(f"{type(node).__name__}.{name} is {type(child).__name__}, not a list")
+                kinds = STATEMENT_CLASSES if name in STATEMENT_LIST_FIELDS else EXPRESSION_CLASSES
+                stack.extend((item, kinds) for item in child)
+            elif child is None:
+                if type(node) is not ExitStmt:
+                    fail(f"{type(node).__name__}.{name} is missing")
+            else:
+                stack.append((child, EXPRESSION_CLASSES))
+
+
+def _verify_fields(node: ASTNode, fail):
+    cls = type(node)
+    if cls is IntLit and type(node.value) is not int:
+        fail(f"IntLit value {node.value!r} is not an int")
+    elif cls is BinaryOp and node.op not in BINARY_OPERATORS:
+        fail(f"unknown binary operator {node.op!r}")
+    elif cls is UnaryOp and node.op not in UNARY_OPERATORS:
+        fail(f"unknown unary operator {node.op!r}")
+    elif cls in (Var, LetStmt, AssignStmt) and type(node.name) is not str:
+        fail(f"{cls.__name__} name {node.name!r} is not a string")
+
+
+def _kind(expected) -> str:
+    if expected is STATEMENT_CLASSES:
+        return "a statement"
+    if expected is EXPRESSION_CLASSES:
+        return "an expression"
+    return expected.__name__
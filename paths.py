@@ -0,0 +1,38 @@
+import glob
+import os
+
+DEFAULT_OUTPUT = "output.asm"
+
+
+def expand_inputs(patterns):
+    """Expand glob patterns (the shell may not have), keeping plain paths as given."""
+    inputs = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+            if not matches:
+                raise ValueError(f"no files match '{pattern}'")
+            inputs.extend(matches)
+        else:
+            inputs.append(pattern)
+    return list(dict.fromkeys(inputs))
+
+
+def output_paths(inputs, output, out_dir):
+    """Pick the .asm path for each input: output (default output.asm) for a lone input, else <name>.asm."""
+    if len(inputs) == 1 and out_dir is None:
+        return [output or DEFAULT_OUTPUT]
+    if output is not None:
+        raise ValueError("-o/--output takes a single input; use --out-dir for several")
+    outputs = []
+    for input_file in inputs:
+        stem = os.path.splitext(os.path.basename(input_file))[0]
+        outputs.append(os.path.join(out_dir if out_dir is not None else os.path.dirname(input_file), stem + ".asm"))
+    seen = {}
+    for input_file, output_file in zip(inputs, outputs):
+        if output_file in seen:
+            raise ValueError(f"'{seen[output_file]}' and '{input_file}' would both be written to '{output_file}'")
+        if os.path.abspath(output_file) == os.path.abspath(input_file):
+            raise ValueError(f"output for '{input_file}' would overwrite the input")
+        seen[output_file] = input_file
+    return outputs
@@ -0,0 +1,332 @@
+import re
+from typing import List, Tuple
+
+PASS_NAME = "peephole"
+
+# Every name that reads or writes part of a 32-bit register.
+REGISTER_PARTS = {
+    "eax": ("eax", "ax", "al", "ah"), "ebx": ("ebx", "bx", "bl", "bh"),
+    "ecx": ("ecx", "cx", "cl", "ch"), "edx": ("edx", "dx", "dl", "dh"),
+    "esi": ("esi", "si"), "edi": ("edi", "di"), "ebp": ("ebp", "bp"), "esp": ("esp", "sp"),
+}
+_MENTIONS = {register: re.compile(r"\b(?:" + "|".join(parts) + r")\b") for register, parts in REGISTER_PARTS.items()}
+INVERTED_JUMPS = {
+    "je": "jne", "jne": "je", "jz": "jnz", "jnz": "jz",
+    "jl": "jge", "jge": "jl", "jg": "jle", "jle": "jg",
+    "jb": "jae", "jae": "jb", "ja": "jbe", "jbe": "ja", "js": "jns", "jns": "js",
+}
+JUMPS = frozenset(INVERTED_JUMPS) | {"jmp"}
+# Instructions that set ZF from their destination's new value.
+ZERO_FLAG_SETTERS = frozenset(("add", "sub", "and", "or", "xor", "neg", "inc", "dec"))
+LABEL_PATTERN = re.compile(r"[A-Za-z_.$][\w.$]*:$")
+
+
+class Instr:
+    """One instruction: `op operand, operand` plus any trailing comment, kept verbatim."""
+
+    __slots__ = ("op", "operands", "comment")
+
+    def __init__(self, op: str, operands: Tuple[str, ...] = (), comment: str = ""):
+        self.op = op
+        self.operands = operands
+        self.comment = comment
+
+    @classmethod
+    def parse(cls, line: str) -> "Instr":
+        comment = ""
+        if ";" in line:
+            code, _, comment = line.partition(";")
+            stripped = code.rstrip()
+            comment = code[len(stripped):] + ";" + comment
+            line = stripped
+        op, _, rest = line.partition(" ")
+        return cls(op, tuple(rest.split(", ")) if rest else (), comment)
+
+    def __str__(self):
+        text = f"{self.op} {', '.join(self.operands)}" if self.operands else self.op
+        return text + self.comment
+
+    def __repr__(self):
+        return f"Instr({str(self)!r})"
+
+
+class Label:
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __str__(self):
+        return f"{self.name}:"
+
+
+def parse_asm(asm: str) -> Tuple[list, List[str]]:
+    """Split assembly into the text section as Instr, Label and verbatim str lines, and the remaining lines.
+
+    Directives, blank lines and comment-only lines stay strings; the peephole
+    rules do not look through them.
+    """
+    code = []
+    lines = asm.split("\n")
+    parse = Instr.parse
+    for index, line in enumerate(lines):
+        if not line or line[0] in "; \t\n" or line.startswith("global"):
+            code.append(line)
+        elif line.startswith("section"):
+            if line != "section .text":
+                return code, lines[index:]
+            code.append(line)
+        elif line[-1] == ":" and LABEL_PATTERN.match(line):
+            code.append(Label(line[:-1]))
+        else:
+            code.append(parse(line))
+    return code, []
+
+
+def mentions(operand: str, register: str) -> bool:
+    """Whether the operand reads or writes any part of the register, addresses included."""
+    return _MENTIONS[register].search(operand) is not None
+
+
+def is_register(operand: str) -> bool:
+    return operand in REGISTER_PARTS
+
+
+def is_memory(operand: str) -> bool:
+    return "[" in operand
+
+
+def is_immediate(operand: str) -> bool:
+    return operand.lstrip("-").isdigit()
+
+
+def _op(item):
+    """The item's opcode, or None for labels and verbatim lines."""
+    return item.op if type(item) is Instr else None
+
+
+# Each rule looks at the end of the already optimized code; on a match it
+# returns (how many trailing items to replace, replacement items).
+
+def _self_move(out):
+    last = out[-1]
+    if last.operands[0] == last.operands[1]:
+        return 1, []
+    return None
+
+
+def _redundant_load(out):
+    """mov A, B; mov B, A: the second move changes nothing."""
+    if len(out) < 2 or _op(out[-2]) != "mov":
+        return None
+    first, second = out[-2], out[-1]
+    a, b = first.operands
+    if second.operands != (b, a):
+        return None
+    for register, other in ((a, b), (b, a)):
+        if is_register(register) and is_memory(other) and mentions(other, register):
+            return None  # the address depends on the register the first move changed
+    return 1, []
+
+
+def _dead_move(out):
+    """mov R, X; mov R, Y: the first value is never seen."""
+    if len(out) < 2 or _op(out[-2]) != "mov":
+        return None
+    first, second = out[-2], out[-1]
+    register = second.operands[0]
+    if first.operands[0] != register or not is_register(register) or mentions(second.operands[1], register):
+        return None
+    return 2, [second]
+
+
+def _forward_move(out):
+    """mov A, X; mov B, A; mov A, Y becomes mov B, X; mov A, Y when A is a register overwritten unread."""
+    if len(out) < 3 or _op(out[-2]) != "mov" or _op(out[-3]) != "mov":
+        return None
+    load, copy, overwrite = out[-3], out[-2], out[-1]
+    a, x = load.operands
+    b, source = copy.operands
+    if source != a or overwrite.operands[0] != a or not is_register(a) or mentions(overwrite.operands[1], a):
+        return None
+    if is_memory(b) and (is_memory(x) or mentions(b, a)):
+        return None
+    if mentions(x, "esp") or b == "esp":
+        return None
+    if is_memory(b) and is_immediate(x) and not b.startswith("dword"):
+        b = f"dword {b}"
+    return 3, [Instr("mov", (b, x), copy.comment), overwrite]
+
+
+def _push_pop(out):
+    """push A; pop B is a move."""
+    if len(out) < 2 or _op(out[-2]) != "push":
+        return None
+    (source,), (destination,) = out[-2].operands, out[-1].operands
+    if mentions(source, "esp") or mentions(destination, "esp"):
+        return None
+    if source == destination:
+        return 2, []
+    if is_memory(source) and is_memory(destination):
+        return None
+    return 2, [Instr("mov", (destination, source.replace("dword ", "", 1) if is_register(destination) else source))]
+
+
+def _compare_zero(out):
+    """cmp R, 0 sets the same flags as the shorter test R, R."""
+    register, value = out[-1].operands
+    if value != "0" or not is_register(register):
+        return None
+    return 1, [Instr("test", (register, register), out[-1].comment)]
+
+
+def _reuse_zero_flag(out):
+    """add/sub/... R, X; test R, R; je/jne: the arithmetic already set ZF for R."""
+    if len(out) < 3 or _op(out[-2]) != "test" or _op(out[-3]) is None:
+        return None
+    jump, test, arithmetic = out[-1], out[-2], out[-3]
+    if jump.op not in ("je", "jne", "jz", "jnz"):
+        return None
+    register = test.operands[0]
+    if test.operands[1] != register or arithmetic.op not in ZERO_FLAG_SETTERS:
+        return None
+    if not arithmetic.operands or arithmetic.operands[0] != register:
+        return None
+    return 2, [jump]
+
+
+def _jump_to_next(out):
+    """A jump to a label that immediately follows it."""
+    index = len(out) - 1
+    names = set()
+    while index >= 0 and type(out[index]) is Label:
+        names.add(out[index].name)
+        index -= 1
+    if index < 0 or _op(out[index]) not in JUMPS or out[index].operands[0] not in names:
+        return None
+    return len(out) - index, out[index + 1:]
+
+
+def _jump_over_jump(out):
+    """jcc L1; jmp L2; L1: becomes jncc L2; L1:."""
+    if len(out) < 3 or _op(out[-2]) != "jmp" or _op(out[-3]) is None:
+        return None
+    branch, jump, label = out[-3], out[-2], out[-1]
+    inverse = INVERTED_JUMPS.get(branch.op)
+    if inverse is None or branch.operands[0] != label.name:
+        return None
+    return 3, [Instr(inverse, jump.operands, branch.comment), label]
+
+
+# (name, what the newest item must be, rule): instructions are keyed by opcode, labels by Label.
+PEEPHOLE_RULES = (
+    ("self-move", "mov", _self_move),
+    ("redundant-load", "mov", _redundant_load),
+    ("forward-move", "mov", _forward_move),
+    ("dead-move", "mov", _dead_move),
+    ("push-pop", "pop", _push_pop),
+    ("compare-zero", "cmp", _compare_zero),
+    ("reuse-zero-flag", "je", _reuse_zero_flag),
+    ("reuse-zero-flag", "jne", _reuse_zero_flag),
+    ("reuse-zero-flag", "jz", _reuse_zero_flag),
+    ("reuse-zero-flag", "jnz", _reuse_zero_flag),
+    ("jump-over-jump", Label, _jump_over_jump),
+    ("jump-to-next", Label, _jump_to_next),
+)
+
+
+def _index_rules():
+    index = {}
+    for name, trigger, rule in PEEPHOLE_RULES:
+        index.setdefault(trigger, []).append((name, rule))
+    return index
+
+
+_RULES_BY_TRIGGER = _index_rules()
+
+
+def optimize(code: list, fired: dict) -> Tuple[list, bool]:
+    """One sweep of the rules over the code; rule names and how often they fired are added to fired.
+
+    Each item is appended to the output and the rules triggered by it are tried
+    on the output's tail. A replacement goes back on the input, so it is matched
+    again together with the code before it.
+    """
+    rules_for = _RULES_BY_TRIGGER
+    label_rules = rules_for.get(Label, ())
+    pending = code[::-1]
+    out = []
+    changed = False
+    while pending:
+        item = pending.pop()
+        out.append(item)
+        cls = type(item)
+        if cls is Instr:
+            candidates = rules_for.get(item.op)
+            if candidates is None:
+                continue
+        elif cls is Label:
+            candidates = label_rules
+        else:
+            continue
+        for name, rule in candidates:
+            result = rule(out)
+            if result is not None:
+                count, replacement = result
+                del out[-count:]
+                pending.extend(reversed(replacement))
+                fired[name] = fired.get(name, 0) + 1
+                changed = True
+                break
+    return out, changed
+
+
+def _remove_unreachable(code: list, fired: dict) -> Tuple[list, bool]:
+    """Drop instructions between an unconditional jmp and the next label: nothing can reach them."""
+    kept = []
+    reachable = True
+    for item in code:
+        cls = type(item)
+        if cls is Label:
+            reachable = True
+        elif cls is Instr:
+            if not reachable:
+                continue
+            if item.op == "jmp":
+                reachable = False
+        kept.append(item)
+    removed = len(code) - len(kept)
+    if removed:
+        fired["unreachable"] = fired.get("unreachable", 0) + removed
+    return kept, removed > 0
+
+
+def _remove_unused_labels(code: list, fired: dict) -> Tuple[list, bool]:
+    referenced = {item.operands[0] for item in code
+                  if type(item) is Instr and (item.op in JUMPS or item.op == "call") and item.operands}
+    kept = [item for item in code if type(item) is not Label or item.name in referenced or item.name == "_start"]
+    removed = len(code) - len(kept)
+    if removed:
+        fired["unused-label"] = fired.get("unused-label", 0) + removed
+    return kept, removed > 0
+
+
+def peephole(asm: str, context) -> str:
+    """Rewrite the text section with PEEPHOLE_RULES until none applies.
+
+    Between sweeps, code after an unconditional jump is dropped up to the next
+    label, and so are labels nothing jumps to, since they split windows the
+    rules could otherwise match. Fired rules are counted in the
+    pass's stats.
+    """
+    code, rest = parse_asm(asm)
+    fired = {}
+    changed = True
+    while changed:
+        code, changed = optimize(code, fired)
+        code, unreachable = _remove_unreachable(code, fired)
+        code, unused = _remove_unused_labels(code, fired)
+        changed = changed or unreachable or unused
+    for name, count in fired.items():
+        context.count(PASS_NAME, name, count)
+    return "\n".join([str(item) for item in code] + rest)
@@ -0,0 +1,157 @@
+from typing import Dict, List, Set
+
+from ast_lib import (ASTNode, AssignStmt, ExitStmt, FunctionCall, IfStmt, IntLit, LetStmt, PrintStmt, Program,
+                     StringLit, Var, WhileStmt, walk)
+
+PASS_NAME = "register-allocation"
+
+# Registers variables may live in. eax, ebx and edx are scratch for expressions,
+# idiv and the syscalls; esi, edi and ebp are callee-saved, so they survive calls.
+ALLOCATABLE_REGISTERS = ("esi", "edi", "ebp")
+# A use or store inside n nested loops counts LOOP_WEIGHT ** n times towards keeping a variable in a register.
+LOOP_WEIGHT = 10
+
+
+class InterferenceGraph:
+    """Variables as nodes, an edge between two variables live at the same time.
+
+    cost[name] estimates how many memory accesses a register saves: every use and
+    store, weighted by loop depth.
+    """
+
+    __slots__ = ("edges", "cost")
+
+    def __init__(self, names):
+        self.edges = {name: set() for name in names}
+        self.cost = dict.fromkeys(names, 0)
+
+    def interfere(self, name: str, others):
+        edges = self.edges
+        if name not in edges:
+            return
+        for other in others:
+            if other != name and other in edges:
+                edges[name].add(other)
+                edges[other].add(name)
+
+    def charge(self, expr: ASTNode, weight: int):
+        cost = self.cost
+        for node, _ in walk(expr):
+            if type(node) is Var and node.name in cost:
+                cost[node.name] += weight
+
+
+def allocate_registers(program: Program, context) -> Program:
+    """Map variables to ALLOCATABLE_REGISTERS by coloring their interference graph.
+
+    The mapping is left in context.registers for the code generator; variables
+    that get no register keep their memory slot, so spilling needs no extra
+    code. Variables whose initial value can be read (live on entry) get an
+    explicit assignment at the start of the program, since a register has no
+    .data initializer. The tree must not change after this pass.
+    """
+    seeds = context.initial_values  # the code generator's .data initial values
+    declared = {}
+    for node, _ in walk(program):
+        if type(node) is LetStmt or (type(node) is Var and node.name in seeds):
+            declared.setdefault(node.name, seeds.get(node.name, 0))
+    if not declared:
+        return program
+
+    graph = InterferenceGraph(declared)
+    entry_live = _analyse_block(program.body, set(), 1, graph)
+    for name in entry_live:
+        graph.interfere(name, entry_live)  # all hold their initial values at once
+
+    registers = color(graph, ALLOCATABLE_REGISTERS)
+    context.registers = registers
+    context.count(PASS_NAME, "allocated", len(registers))
+    if len(registers) < len(declared):
+        context.count(PASS_NAME, "in_memory", len(declared) - len(registers))
+    program.body[:0] = [AssignStmt(name, IntLit(declared[name]))
+                        for name in declared if name in entry_live and name in registers]
+    return program
+
+
+def _uses(expr) -> Set[str]:
+    return {node.name for node, _ in walk(expr) if type(node) is Var}
+
+
+def _analyse_block(statements: List[ASTNode], live: Set[str], weight: int, graph: InterferenceGraph) -> Set[str]:
+    """Backward liveness over a block, adding interference edges and costs; returns the variables live on entry.
+
+    A loop's head takes every variable the loop reads as live, which contains the
+    loop's liveness fixpoint, so one walk per loop is enough.
+    """
+    for statement in reversed(statements):
+        cls = type(statement)
+        if cls is LetStmt or cls is AssignStmt:
+            name = statement.name
+            graph.charge(statement.expr, weight)
+            if name in graph.cost:
+                graph.cost[name] += weight
+            after = live
+            if type(statement.expr) is Var:
+                after = live - {statement.expr.name}  # a copy may share the source's register
+            graph.interfere(name, after)
+            live = (live - {name}) | _uses(statement.expr)
+        elif cls is IfStmt:
+            graph.charge(statement.condition, weight)
+            then_live = _analyse_block(statement.then_body, live, weight, graph)
+            else_live = _analyse_block(statement.else_body, live, weight, graph)
+            live = then_live | else_live | _uses(statement.condition)
+        elif cls is WhileStmt:
+            inner = weight * LOOP_WEIGHT
+            graph.charge(statement.condition, inner)
+            live = live | _uses(statement)
+            _analyse_block(statement.body, live, inner, graph)
+        elif cls is ExitStmt:
+            graph.charge(statement.arg, weight)
+            live = _uses(statement.arg)
+        elif cls is PrintStmt:
+            if type(statement.arg) is not StringLit:
+                graph.charge(statement.arg, weight)
+                live = live | _uses(statement.arg)
+        elif cls is FunctionCall:
+            graph.charge(statement, weight)
+            live = live | _uses(statement)
+    return live
+
+
+def color(graph: InterferenceGraph, registers) -> Dict[str, str]:
+    """Chaitin-Briggs coloring: variables that get no register are simply left out of the result.
+
+    Variables with fewer neighbours than registers are removed first, since they
+    can always be colored; when none is left, the one with the lowest cost per
+    neighbour is removed optimistically. Popping assigns each variable the first
+    register none of its colored neighbours holds.
+    """
+    k = len(registers)
+    degree = {name: len(neighbours) for name, neighbours in graph.edges.items()}
+    low = [name for name, count in degree.items() if count < k]
+    removed = set()
+    order = []
+    while len(order) < len(degree):
+        if low:
+            name = low.pop()
+            if name in removed:
+                continue
+        else:
+            name = min((candidate for candidate in degree if candidate not in removed),
+                       key=lambda candidate: graph.cost[candidate] / (degree[candidate] + 1))
+        removed.add(name)
+        order.append(name)
+        for neighbour in sorted(graph.edges[name]):  # sorted: set order varies between runs
+            if neighbour not in removed:
+                degree[neighbour] -= 1
+                if degree[neighbour] == k - 1:
+                    low.append(neighbour)
+
+    assigned = {}
+    for name in reversed(order):
+        taken = {assigned.get(neighbour) for neighbour in graph.edges[name]}
+        for register in registers:
+            if register not in taken:
+                assigned[name] = register
+                break
+    return assigned
@@ -0,0 +1,126 @@
+# Output routines the code generator appends to programs that print. print appends
+# to output_buffer instead of making a sys_write per statement; the buffer is written
+# out when the next print would overflow it and before the program exits. The
+# routines may change eax, ebx, ecx and edx, which hold no values between
+# statements, and preserve esi, edi and ebp, which may hold variables.
+
+OUTPUT_BUFFER_SIZE = 4096
+# "-2147483648" and the newline
+MAX_INT_LENGTH = 12
+
+# flush_output: write the buffered output to stdout; preserves every register.
+FLUSH_OUTPUT = [
+    "flush_output:",
+    "push eax",
+    "push ebx",
+    "push ecx",
+    "push edx",
+    "mov edx, [output_length]",
+    "test edx, edx",
+    "jz flush_output_done",
+    "mov eax, 4    ; sys_write",
+    "mov ebx, 1    ; stdout",
+    "mov ecx, output_buffer",
+    "int 0x80",
+    "mov dword [output_length], 0",
+    "flush_output_done:",
+    "pop edx",
+    "pop ecx",
+    "pop ebx",
+    "pop eax",
+    "ret",
+]
+
+# print_int: append eax as a signed decimal and a newline. Digits come from
+# dividing by 10 with a multiply by the reciprocal 0xCCCCCCCD / 2^35, and are
+# pushed least significant first, then popped into the buffer in order.
+PRINT_INT = [
+    "print_int:",
+    f"cmp dword [output_length], {OUTPUT_BUFFER_SIZE - MAX_INT_LENGTH}",
+    "jbe print_int_room",
+    "call flush_output",
+    "print_int_room:",
+    "push esi",
+    "push edi",
+    "mov edi, [output_length]",
+    "add edi, output_buffer",
+    "mov ecx, eax",
+    "test ecx, ecx",
+    "jns print_int_digits",
+    "mov byte [edi], 45    ; '-'",
+    "inc edi",
+    "neg ecx    ; -2147483648 stays 0x80000000, which is right unsigned",
+    "print_int_digits:",
+    "mov esi, esp",
+    "print_int_digit:",
+    "mov eax, 0xCCCCCCCD",
+    "mul ecx",
+    "shr edx, 3    ; edx = ecx / 10",
+    "lea eax, [edx + edx*4]",
+    "add eax, eax",
+    "sub ecx, eax    ; ecx = ecx % 10",
+    "add ecx, 48    ; '0'",
+    "push ecx",
+    "mov ecx, edx",
+    "test ecx, ecx",
+    "jnz print_int_digit",
+    "print_int_store:",
+    "pop eax",
+    "mov [edi], al",
+    "inc edi",
+    "cmp esp, esi",
+    "jne print_int_store",
+    "mov byte [edi], 10",
+    "inc edi",
+    "sub edi, output_buffer",
+    "mov [output_length], edi",
+    "pop edi",
+    "pop esi",
+    "ret",
+]
+
+# print_string: append edx bytes from ecx; text longer than the buffer is written directly.
+PRINT_STRING = [
+    "print_string:",
+    "mov eax, [output_length]",
+    "add eax, edx",
+    f"cmp eax, {OUTPUT_BUFFER_SIZE}",
+    "jbe print_string_copy",
+    "call flush_output",
+    f"cmp edx, {OUTPUT_BUFFER_SIZE}",
+    "jbe print_string_copy",
+    "mov eax, 4    ; sys_write",
+    "mov ebx, 1    ; stdout",
+    "int 0x80",
+    "ret",
+    "print_string_copy:",
+    "push esi",
+    "push edi",
+    "mov esi, ecx",
+    "mov edi, [output_length]",
+    "add [output_length], edx",
+    "add edi, output_buffer",
+    "mov ecx, edx",
+    "cld",
+    "rep movsb",
+    "pop edi",
+    "pop esi",
+    "ret",
+]
+
+OUTPUT_BSS = [
+    f"output_buffer: resb {OUTPUT_BUFFER_SIZE}",
+    "output_length: resd 1",
+]
+
+
+def runtime_routines(prints_integers: bool, prints_strings: bool) -> list:
+    """The routines a program needs, as lines of assembly; none for a program that never prints."""
+    if not prints_integers and not prints_strings:
+        return []
+    lines = ["\n; Runtime: buffered output"] + FLUSH_OUTPUT
+    if prints_integers:
+        lines += PRINT_INT
+    if prints_strings:
+        lines += PRINT_STRING
+    return lines
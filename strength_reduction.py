@@ -0,0 +1,128 @@
+from typing import List, Optional, Tuple
+
+from ast_lib import BinaryOp, IntLit, Program, walk
+from constant_folding import wrap32
+
+PASS_NAME = "strength-reduction"
+# Multipliers a single `lea r, [r + r*(m-1)]` applies.
+LEA_MULTIPLIERS = (3, 5, 9)
+# Longest shift/lea/neg sequence worth emitting instead of one imul.
+MAX_MULTIPLY_STEPS = 3
+
+
+class Reduction:
+    """How the code generator computes one `*` or `/` by a constant without imul or idiv.
+
+    `operand` names the child holding the other operand ("left" or "right").
+    For a multiplication `steps` lists ("lea", m), ("shl", k) and ("neg",)
+    applied in order. A division by +-2**shift is a rounding add and an
+    arithmetic shift; any other divisor multiplies by `magic` (a signed 32-bit
+    value), adds the dividend back when `add_dividend`, and shifts right by
+    `shift`. `negate` flips the quotient's sign for a negative divisor.
+    """
+
+    __slots__ = ("kind", "operand", "steps", "magic", "shift", "add_dividend", "negate")
+
+    MULTIPLY = "multiply"
+    POWER_OF_TWO = "power-of-two"
+    MAGIC = "magic"
+
+    def __init__(self, kind: str, operand: str = "left", steps: Tuple[tuple, ...] = (), magic: int = 0,
+                 shift: int = 0, add_dividend: bool = False, negate: bool = False):
+        self.kind = kind
+        self.operand = operand
+        self.steps = steps
+        self.magic = magic
+        self.shift = shift
+        self.add_dividend = add_dividend
+        self.negate = negate
+
+
+def reduce_strength(program: Program, context) -> Program:
+    """Choose cheaper instructions for multiplications and divisions by a literal.
+
+    The choices are left in context.reductions, by node id, for the code
+    generator; the tree itself does not change. Multipliers that are a power of
+    two times 3, 5 or 9 (or two of them) become shifts and lea; divisors that are
+    a power of two become a shift with the rounding fixup that makes it
+    truncate toward zero like idiv; other divisors become a multiplication by a
+    magic reciprocal. Divisions by 0 and -1 keep their idiv, which faults like
+    the program expects.
+    """
+    reductions = {}
+    for node, _ in walk(program):
+        if type(node) is not BinaryOp:
+            continue
+        reduction = None
+        if node.op == "*":
+            if type(node.right) is IntLit:
+                reduction = _multiplication(wrap32(node.right.value), "left")
+            elif type(node.left) is IntLit:
+                reduction = _multiplication(wrap32(node.left.value), "right")
+        elif node.op == "/" and type(node.right) is IntLit:
+            reduction = _division(wrap32(node.right.value))
+        if reduction is not None:
+            reductions[id(node)] = reduction
+            context.count(PASS_NAME, reduction.kind)
+    context.reductions = reductions
+    return program
+
+
+def _multiplication(multiplier: int, operand: str) -> Optional[Reduction]:
+    steps = multiply_steps(multiplier)
+    if steps is None:
+        return None
+    return Reduction(Reduction.MULTIPLY, operand, steps=tuple(steps))
+
+
+def multiply_steps(multiplier: int) -> Optional[List[tuple]]:
+    """Steps computing x * multiplier (mod 2**32) in place, or None if imul is as cheap."""
+    if multiplier == 0:
+        return None
+    magnitude = abs(multiplier)
+    shift = (magnitude & -magnitude).bit_length() - 1
+    odd = magnitude >> shift
+    factors = None
+    if odd == 1:
+        factors = []
+    elif odd in LEA_MULTIPLIERS:
+        factors = [odd]
+    else:
+        for first in LEA_MULTIPLIERS:
+            if odd % first == 0 and odd // first in LEA_MULTIPLIERS:
+                factors = [first, odd // first]
+                break
+    if factors is None:
+        return None
+    steps = [("lea", factor) for factor in factors]
+    if shift:
+        steps.append(("shl", shift))
+    if multiplier < 0:
+        steps.append(("neg",))
+    return steps if len(steps) <= MAX_MULTIPLY_STEPS else None
+
+
+def _division(divisor: int) -> Optional[Reduction]:
+    if divisor in (0, -1, 1):
+        return None  # 1 is left to constant folding; 0 and -1 must fault like idiv
+    magnitude = abs(divisor)
+    if magnitude & (magnitude - 1) == 0:
+        return Reduction(Reduction.POWER_OF_TWO, shift=magnitude.bit_length() - 1, negate=divisor < 0)
+    magic, shift = signed_magic(magnitude)
+    return Reduction(Reduction.MAGIC, magic=wrap32(magic), shift=shift, add_dividend=magic >= 2 ** 31,
+                     negate=divisor < 0)
+
+
+def signed_magic(divisor: int) -> Tuple[int, int]:
+    """(m, s) with n / divisor == (n * m) >> (32 + s), rounded toward zero, for every signed 32-bit n.
+
+    The smallest s for which m = ceil(2**(32+s) / divisor) is exact
+    (Granlund and Montgomery); divisor is at least 2 and not a power of two,
+    so m lies in [2**31, 2**32) or below and fits 32 bits unsigned.
+    """
+    for shift in range(32):
+        power = 2 ** (32 + shift)
+        magic = -(-power // divisor)
+        if (magic * divisor - power) * 2 ** 31 < power:
+            return magic, shift
+    raise ValueError(f"no magic number for {divisor}")
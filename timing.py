@@ -0,0 +1,137 @@
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Iterable, Optional
+
+
+class PhaseTimer:
+    """Wall time, CPU time and tracemalloc peak per compiler phase (--time-passes).
+
+    Phases are recorded in the order they run; a phase entered twice accumulates.
+    The peak is the most memory the phase had allocated (net of frees) at any
+    point, not counting what was already in use when it started. Tracing
+    allocations slows the compiler down, so memory tracking can be turned off for
+    pure timings.
+    """
+
+    __slots__ = ("phases", "counts", "track_memory")
+
+    def __init__(self, track_memory: bool = True):
+        self.phases = {}
+        self.counts = {}
+        self.track_memory = track_memory
+
+    @contextmanager
+    def phase(self, name: str):
+        tracking = self.track_memory
+        if tracking:
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            in_use = tracemalloc.get_traced_memory()[0]
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            peak = 0
+            if tracking:
+                peak = tracemalloc.get_traced_memory()[1] - in_use
+                if started_tracing:
+                    tracemalloc.stop()
+            self.record(name, wall, cpu, peak)
+
+    def record(self, name: str, wall: float, cpu: float, peak: int = 0):
+        """Add wall and CPU seconds to a phase, and raise its peak to `peak` bytes."""
+        record = self.phases.setdefault(name, {"wall_ms": 0.0, "cpu_ms": 0.0, "peak_kb": 0.0})
+        record["wall_ms"] += wall * 1000
+        record["cpu_ms"] += cpu * 1000
+        record["peak_kb"] = max(record["peak_kb"], peak / 1024)
+
+    def split(self, name: str, part: str, wall: float):
+        """Move `wall` seconds spent inside phase `name` over to phase `part`.
+
+        CPU time moves in the same proportion: reading the process CPU clock costs
+        a system call, too much to do per token.
+        """
+        record = self.phases[name]
+        cpu = record["cpu_ms"] / 1000 * min(1.0, wall * 1000 / record["wall_ms"]) if record["wall_ms"] else 0.0
+        self.record(part, wall, cpu)
+        self.record(name, -wall, -cpu)
+
+    def as_dict(self) -> dict:
+        return {"phases": self.phases, "counts": self.counts}
+
+
+class IteratorClock:
+    """Wraps an iterator, adding up the wall time spent producing its items.
+
+    This times a producer that runs interleaved with its consumer, such as the
+    scanner feeding the parser.
+    """
+
+    __slots__ = ("_iterator", "wall", "items")
+
+    def __init__(self, iterable: Iterable):
+        self._iterator = iter(iterable)
+        self.wall = 0.0
+        self.items = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            item = next(self._iterator)
+        finally:
+            self.wall += time.perf_counter() - start
+        self.items += 1
+        return item
+
+    def close(self):
+        close = getattr(self._iterator, "close", None)
+        if close is not None:
+            close()
+
+
+def phase(timer: Optional[PhaseTimer], name: str):
+    """timer.phase(name), or a no-op context when timing is off."""
+    return timer.phase(name) if timer is not None else nullcontext()
+
+
+def count_instructions(asm: str) -> int:
+    """Instructions in the text section: lines that are not blank, comments, labels or directives."""
+    count = 0
+    for line in asm.splitlines():
+        line = line.split(";", 1)[0].strip()
+        if not line or line.endswith(":") or line.startswith("global"):
+            continue
+        if line.startswith("section"):
+            if line != "section .text":
+                break
+            continue
+        count += 1
+    return count
+
+
+def format_report(name: str, report: dict) -> str:
+    """Render PhaseTimer.as_dict() output as a table, like -ftime-passes."""
+    width = max([20] + [len(phase_name) for phase_name in report["phases"]])
+    lines = [f"Time/memory report for {name}:",
+             f"  {'phase':<{width}} {'wall ms':>10} {'cpu ms':>10} {'peak KB':>10}"]
+    total_wall = total_cpu = 0.0
+    for phase_name, record in report["phases"].items():
+        total_wall += record["wall_ms"]
+        total_cpu += record["cpu_ms"]
+        lines.append(f"  {phase_name:<{width}} {record['wall_ms']:>10.2f} {record['cpu_ms']:>10.2f} "
+                     f"{record['peak_kb']:>10.1f}")
+    lines.append(f"  {'total':<{width}} {total_wall:>10.2f} {total_cpu:>10.2f}")
+    for count_name, value in report["counts"].items():
+        if isinstance(value, dict):
+            breakdown = ", ".join(f"{key} {number}" for key, number in value.items())
+            lines.append(f"  {count_name}: {sum(value.values())} ({breakdown})")
+        else:
+            lines.append(f"  {count_name}: {value}")
+    return "\n".join(lines)
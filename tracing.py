@@ -0,0 +1,46 @@
+import os
+import sys
+
+PHASES = ("lex", "parse", "opt", "codegen", "cache")
+TRACE_ENV_VAR = "CASSAVA_TRACE"
+
+
+class Tracer:
+    """Per-phase debug tracing, off unless --trace or CASSAVA_TRACE turns it on.
+
+    Each phase attribute holds that phase's trace level (0 = off, 1 = one line per
+    statement, 2 = every node/token). Call sites test the level before building a
+    message, e.g. ``if trace.parse: trace.log("parse", f"...")``, so with tracing off
+    no formatting happens; per-token and per-node hooks are chosen once per run
+    rather than tested inside the hot loops.
+    """
+
+    __slots__ = PHASES + ("stream",)
+
+    def __init__(self):
+        for phase in PHASES:
+            setattr(self, phase, 0)
+        self.stream = sys.stderr
+
+    def configure(self, spec: str):
+        """Apply a spec like "parse", "lex,codegen:2" or "all:2"; an empty spec turns tracing off."""
+        for phase in PHASES:
+            setattr(self, phase, 0)
+        for item in filter(None, (part.strip() for part in spec.split(","))):
+            phase, _, level = item.partition(":")
+            if phase != "all" and phase not in PHASES:
+                raise ValueError(f"unknown trace phase '{phase}' (expected one of: all, {', '.join(PHASES)})")
+            if level and not level.isdigit():
+                raise ValueError(f"invalid trace level '{level}' for phase '{phase}'")
+            for name in (PHASES if phase == "all" else (phase,)):
+                setattr(self, name, int(level) if level else 1)
+
+    def log(self, phase: str, message: str):
+        self.stream.write(f"[{phase}] {message}\n")
+
+
+trace = Tracer()
+try:
+    trace.configure(os.environ.get(TRACE_ENV_VAR, ""))
+except ValueError as error:
+    sys.stderr.write(f"warning: ignoring ${TRACE_ENV_VAR}: {error}\n")